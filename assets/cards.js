@@ -0,0 +1,50 @@
+// Marks message bodies that overflow their card with the `scrollable` class.
+// Only cards in view are watched for size changes, and all size reads for a
+// frame happen together before any class is changed, so layout runs once per
+// frame instead of once per card.
+(function() {
+    const pending = new Set();
+    let scheduled = false;
+
+    function measure() {
+        scheduled = false;
+        const results = [];
+        pending.forEach(el => results.push([el, el.scrollHeight > el.clientHeight]));
+        pending.clear();
+        results.forEach(([el, overflows]) => el.classList.toggle('scrollable', overflows));
+    }
+
+    function queue(el) {
+        pending.add(el);
+        if (!scheduled) {
+            scheduled = true;
+            requestAnimationFrame(measure);
+        }
+    }
+
+    // ResizeObserver reports every element once when observed, then on each resize
+    const resizes = new ResizeObserver(entries => entries.forEach(entry => queue(entry.target)));
+
+    const visibility = new IntersectionObserver(entries => entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            resizes.observe(entry.target);
+        } else {
+            resizes.unobserve(entry.target);
+            if (!entry.target.isConnected) visibility.unobserve(entry.target);
+        }
+    }), {rootMargin: '200px'});
+
+    function observe(root) {
+        if (root.matches && root.matches('.message-content')) visibility.observe(root);
+        if (root.querySelectorAll) root.querySelectorAll('.message-content').forEach(el => visibility.observe(el));
+    }
+
+    // htmx fires htmx:load for the page body and for every swapped-in element
+    document.addEventListener('htmx:load', event => observe(event.detail.elt));
+
+    // For cards that live.js and virtual.js add themselves: what htmx does for swapped-in content
+    window.activateCards = function(el) {
+        htmx.process(el);
+        el.dispatchEvent(new CustomEvent('htmx:load', {bubbles: true, detail: {elt: el}}));
+    };
+})();
@@ -0,0 +1,19 @@
+// Live feed: cards pushed over /events go to the top of the message list, except
+// ones already on the page and while it shows search results.
+document.addEventListener('DOMContentLoaded', function() {
+    if (!window.EventSource) return;
+    const source = new EventSource('/events');
+    source.onmessage = function(event) {
+        const list = document.querySelector('#message-list:not([data-search])');
+        if (!list) return;
+        const template = document.createElement('template');
+        template.innerHTML = event.data;
+        const card = template.content.firstElementChild;
+        if (!card || (card.id && document.getElementById(card.id))) return;
+        if (list.hasAttribute('data-virtual') && window.prependVirtualCard && prependVirtualCard(list, card)) return;
+        const grid = list.querySelector('.message-grid');
+        if (!grid) return;
+        grid.prepend(card);
+        activateCards(card);
+    };
+});
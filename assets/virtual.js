@@ -0,0 +1,112 @@
+// Windowed message grid for #message-list[data-virtual]: chunks load from
+// /messages/chunk while scrolling, and a chunk far from the viewport is kept as
+// HTML behind an empty element of the same height until it comes back.
+(function() {
+    const MARGIN = '1500px';
+
+    function mount(chunk) {
+        if (chunk.html === null) return;
+        chunk.el.innerHTML = chunk.html;
+        chunk.html = null;
+        chunk.el.style.height = '';
+        chunk.el.classList.remove('unmounted');
+        activateCards(chunk.el);
+    }
+
+    function unmount(chunk, height) {
+        if (chunk.html !== null) return;
+        chunk.html = chunk.el.innerHTML;
+        chunk.el.style.height = height + 'px';
+        chunk.el.classList.add('unmounted');
+        chunk.el.textContent = '';
+    }
+
+    const lists = new WeakMap();
+
+    function init(list) {
+        const chunks = new Map();
+        lists.set(list, chunks);
+        const windowed = new IntersectionObserver(entries => entries.forEach(entry => {
+            const chunk = chunks.get(entry.target);
+            if (entry.isIntersecting) {
+                mount(chunk);
+            } else {
+                unmount(chunk, entry.boundingClientRect.height);
+            }
+        }), {rootMargin: MARGIN + ' 0px'});
+
+        function track(el) {
+            chunks.set(el, {el: el, html: null});
+            windowed.observe(el);
+        }
+
+        list.querySelectorAll('.message-grid').forEach(track);
+
+        let cursor = list.dataset.nextCursor;
+        let loading = false;
+        let sentinelVisible = false;
+        const sentinel = document.createElement('div');
+        sentinel.className = 'load-more';
+        sentinel.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+        if (cursor) list.appendChild(sentinel);
+
+        async function loadMore() {
+            if (loading || !cursor) return;
+            loading = true;
+            let loaded = false;
+            try {
+                const response = await fetch('/messages/chunk?cursor=' + encodeURIComponent(cursor));
+                if (!response.ok) return;
+                const html = await response.text();
+                cursor = response.headers.get('X-Next-Cursor');
+                const el = document.createElement('div');
+                el.className = 'message-grid';
+                el.innerHTML = html;
+                list.insertBefore(el, sentinel);
+                activateCards(el);
+                track(el);
+                loaded = true;
+            } catch (e) {
+                console.error('Could not load messages', e);
+            } finally {
+                loading = false;
+                if (!cursor) sentinel.remove();
+            }
+            // The observer only reports changes, so keep going while the sentinel stays in range
+            if (loaded && sentinelVisible) loadMore();
+        }
+
+        new IntersectionObserver(entries => {
+            sentinelVisible = entries[entries.length - 1].isIntersecting;
+            if (sentinelVisible) loadMore();
+        }, {rootMargin: MARGIN + ' 0px'}).observe(sentinel);
+    }
+
+    // For live.js: a new card goes to the top of the first chunk, or into its
+    // saved HTML while that chunk is unmounted so that mount() keeps it
+    window.prependVirtualCard = function(list, card) {
+        const chunks = lists.get(list);
+        const chunk = chunks && chunks.get(list.querySelector('.message-grid'));
+        if (!chunk) return false;
+        if (chunk.html === null) {
+            chunk.el.prepend(card);
+            activateCards(card);
+        } else if (!card.id || !chunk.html.includes('id="' + card.id + '"')) {
+            chunk.html = card.outerHTML + chunk.html;
+        }
+        return true;
+    };
+
+    const started = new WeakSet();
+
+    function start(root) {
+        const list = root.matches('#message-list[data-virtual]') ? root : root.querySelector('#message-list[data-virtual]');
+        if (!list || started.has(list)) return;
+        started.add(list);
+        init(list);
+    }
+
+    document.addEventListener('DOMContentLoaded', () => start(document.body));
+    // The list is swapped back in by htmx when the search box is cleared
+    document.addEventListener('htmx:load', event => start(event.detail.elt));
+})();
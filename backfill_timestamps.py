@@ -0,0 +1,51 @@
+"""One-shot migration: convert legacy string `timestamp` fields to `created_at` datetimes.
+
+Run once after deploying the created_at schema:
+
+    python backfill_timestamps.py [batch_size]
+"""
+import asyncio
+import sys
+from pymongo import UpdateOne
+from main import storage, parse_legacy_timestamp
+from storage import MongoStorage
+
+DEFAULT_BATCH_SIZE = 1000
+
+async def backfill(batch_size=DEFAULT_BATCH_SIZE):
+    # main.storage may be wrapped for metrics
+    backend = getattr(storage, "backend", storage)
+    if not isinstance(backend, MongoStorage):
+        raise EnvironmentError("Legacy timestamps only exist in the Mongo backend")
+    await storage.connect()
+    converted = skipped = 0
+    # Undated entries sort as the oldest, so archival may already have moved them
+    for collection in (backend.collection, backend.cold):
+        legacy = collection.find(
+            {"created_at": {"$exists": False}, "timestamp": {"$type": "string"}},
+            {"timestamp": 1},
+            batch_size=batch_size,
+        )
+        ops = []
+        async for doc in legacy:
+            try:
+                created_at = parse_legacy_timestamp(doc["timestamp"])
+            except ValueError:
+                print(f"Skipping {doc['_id']}: unparseable timestamp {doc['timestamp']!r}")
+                skipped += 1
+                continue
+            ops.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"created_at": created_at}, "$unset": {"timestamp": ""}},
+            ))
+            if len(ops) >= batch_size:
+                converted += (await collection.bulk_write(ops, ordered=False)).modified_count
+                ops = []
+        if ops:
+            converted += (await collection.bulk_write(ops, ordered=False)).modified_count
+    return converted, skipped
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+    converted, skipped = asyncio.run(backfill(batch_size))
+    print(f"Backfilled {converted} messages ({skipped} skipped)")
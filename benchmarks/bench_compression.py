@@ -0,0 +1,56 @@
+"""Bytes on the wire and CPU time per response for gzip and brotli at several levels.
+
+    python benchmarks/bench_compression.py [--cards 24] [--runs 50]
+
+Compresses a full GET / page built from synthetic cards, the way
+CompressionMiddleware does for one response, plus every file in assets/.
+STORAGE_BACKEND=sqlite avoids needing MONGO_URI.
+"""
+import argparse
+import os
+import sys
+import time
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+from compression import Compressor, PRECOMPRESS_EXCLUDE
+
+SETTINGS = [("gzip", 1), ("gzip", 6), ("gzip", 9), ("br", 1), ("br", 4), ("br", 11)]
+
+def synthetic_page(cards):
+    messages = [
+        {"_id": ObjectId(), "name": f"guest{i}", "message": f"Message number {i}. " * 20, "created_at": main.utc_now()}
+        for i in range(cards)
+    ]
+    body = "".join(main.to_xml(part) for part in main.render_message_page(messages, None))
+    return main.PAGE_HEAD + main.LIST_HEAD + body.encode() + main.LIST_TAIL + main.PAGE_TAIL
+
+def compress(data, encoding, level):
+    compressor = Compressor(encoding, gzip_level=level, brotli_quality=level)
+    return compressor.compress(data, final=True)
+
+def measure(data, encoding, level, runs):
+    start = time.process_time()
+    for _ in range(runs):
+        size = len(compress(data, encoding, level))
+    return size, (time.process_time() - start) / runs * 1000
+
+def report(label, data, runs):
+    print(f"\n{label}: {len(data):,} bytes uncompressed")
+    print(f"{'encoding':>10} {'level':>6} {'bytes':>10} {'ratio':>7} {'cpu ms':>8}")
+    for encoding, level in SETTINGS:
+        size, cpu_ms = measure(data, encoding, level, runs)
+        print(f"{encoding:>10} {level:>6} {size:>10,} {len(data) / size:>6.1f}x {cpu_ms:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=main.PAGE_SIZE)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    report(f"GET / with {args.cards} cards", synthetic_page(args.cards), args.runs)
+    for name in sorted(os.listdir(main.ASSETS_DIR)):
+        if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXCLUDE:
+            with open(os.path.join(main.ASSETS_DIR, name), "rb") as f:
+                report(f"assets/{name}", f.read(), args.runs)
@@ -0,0 +1,71 @@
+"""Fan-out latency of the /events broadcaster with many idle clients.
+
+    python benchmarks/bench_events.py [clients...] [--events 20]
+
+Each client consumes main.event_stream(), the generator behind /events, in
+its own task, as it would under uvicorn minus the socket. Latency is from
+Broadcaster.publish() to the event coming out of every client's stream.
+Memory is traced per connected client. STORAGE_BACKEND=sqlite avoids
+needing MONGO_URI.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+
+DEFAULT_CLIENTS = (100, 1_000, 10_000)
+
+async def client(received, ready, done, count):
+    stream = main.event_stream()
+    await stream.__anext__()  # retry: line, sent once the client is subscribed
+    ready.release()
+    async for event in stream:
+        if not event.startswith(b":"):
+            received.append(time.perf_counter())
+            if len(received) == count:
+                done.set()
+
+async def run(count, events):
+    main.broadcaster = main.Broadcaster(main.EVENTS_BUFFER)
+    received = []
+    ready = asyncio.Semaphore(0)
+    done = asyncio.Event()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(client(received, ready, done, count)) for _ in range(count)]
+    for _ in range(count):
+        await ready.acquire()
+    per_client = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+
+    latencies = []
+    for i in range(events):
+        received.clear()
+        done.clear()
+        entry = {"_id": ObjectId(), "name": f"guest{i}", "message": "Hello! " * 20, "created_at": main.utc_now()}
+        published = time.perf_counter()
+        main.broadcaster.publish(entry)
+        await done.wait()
+        latencies.append((max(received) - published) * 1000)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, per_client
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("clients", type=int, nargs="*", default=DEFAULT_CLIENTS)
+    parser.add_argument("--events", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'clients':>8} {'last client p50 ms':>19} {'max ms':>8} {'KB/client':>10}")
+    for count in args.clients:
+        latencies, per_client = asyncio.run(run(count, args.events))
+        print(f"{count:>8} {statistics.median(latencies):>19.2f} {max(latencies):>8.2f} {per_client / 1024:>10.1f}")
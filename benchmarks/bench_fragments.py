@@ -0,0 +1,50 @@
+"""Cards/sec for render_message_list() assembly with a cold vs warm fragment cache.
+
+    python benchmarks/bench_fragments.py [sizes...]
+
+No documents are read or written; the app is imported with SQLite storage in a
+temporary directory, so no MONGO_URI is needed.
+"""
+import os
+import sys
+import tempfile
+import time
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+import main
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+def synthetic_messages(count):
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"guest{i}",
+            "message": f"Message number {i}. " * 10,
+            "created_at": main.utc_now(),
+        }
+        for i in range(count)
+    ]
+
+def cards_per_second(messages):
+    start = time.perf_counter()
+    main.render_message_page(messages, None)
+    return len(messages) / (time.perf_counter() - start)
+
+def run(count):
+    messages = synthetic_messages(count)
+    # Give the cache room for every card so the warm pass measures pure hits
+    main.fragment_cache = main.FragmentCache(max_bytes=1 << 40)
+    cold = cards_per_second(messages)
+    warm = cards_per_second(messages)
+    return cold, warm, main.fragment_cache.bytes
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'messages':>10} {'cold cards/s':>14} {'warm cards/s':>14} {'speedup':>8} {'cache MB':>9}")
+    for count in sizes:
+        cold, warm, size = run(count)
+        print(f"{count:>10} {cold:>14,.0f} {warm:>14,.0f} {warm / cold:>7.1f}x {size / 2**20:>9.1f}")
@@ -0,0 +1,79 @@
+"""Throughput of the moderation checks on MAX_MESSAGE_CHAR-length messages.
+
+    python benchmarks/bench_moderation.py [--terms 100 1000 10000] [--messages 20]
+
+Blocklists are random words that mostly do not occur in the messages, the
+worst case, since a match ends the scan early. The trie-shaped regex that
+moderation.Blocklist compiles is compared with a plain alternation of the same
+terms. Near-duplicate checks run against a full NEAR_DUPLICATE_WINDOW of
+recent sketches.
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from moderation import Blocklist, Moderator, NearDuplicates, count_links
+
+MAX_MESSAGE_CHAR = 50_000
+NEAR_DUPLICATE_WINDOW = 1000
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+def make_message(rng, vocabulary):
+    words = []
+    length = 0
+    while length < MAX_MESSAGE_CHAR:
+        word = rng.choice(vocabulary) if rng.random() > 0.001 else "https://example.com/" + random_word(rng)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:MAX_MESSAGE_CHAR]
+
+def throughput(check, messages):
+    start = time.perf_counter()
+    for message in messages:
+        check(message)
+    elapsed = time.perf_counter() - start
+    return sum(map(len, messages)) / elapsed / 1e6, elapsed / len(messages) * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(1)
+    vocabulary = [random_word(rng) for _ in range(5000)]
+    messages = [make_message(rng, vocabulary) for _ in range(args.messages)]
+
+    print(f"{'check':<34} {'MB/s':>8} {'ms/message':>11}")
+    for size in args.terms:
+        terms = [random_word(rng) + random_word(rng) for _ in range(size)]
+        alternation = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\b")
+        mb, ms = throughput(alternation.search, messages)
+        print(f"{f'alternation, {size} terms':<34} {mb:>8.1f} {ms:>11.2f}")
+        mb, ms = throughput(Blocklist(terms).find, messages)
+        print(f"{f'trie regex, {size} terms':<34} {mb:>8.1f} {ms:>11.2f}")
+
+    mb, ms = throughput(lambda message: count_links(message, 3), messages)
+    print(f"{'links':<34} {mb:>8.1f} {ms:>11.2f}")
+
+    near = NearDuplicates(0.8, NEAR_DUPLICATE_WINDOW)
+    for _ in range(NEAR_DUPLICATE_WINDOW):
+        near.check(near.sketch(" ".join(rng.choices(vocabulary, k=200))))
+    mb, ms = throughput(near.sketch, messages)
+    print(f"{'near-duplicate sketch':<34} {mb:>8.1f} {ms:>11.2f}")
+    sketches = [near.sketch(message) for message in messages]
+    start = time.perf_counter()
+    for sketch in sketches:
+        near.check(sketch)
+    print(f"{f'near-duplicate lookup, {NEAR_DUPLICATE_WINDOW} recent':<34} {'':>8} {(time.perf_counter() - start) / len(sketches) * 1000:>11.2f}")
+
+    terms = [random_word(rng) + random_word(rng) for _ in range(args.terms[-1])]
+    moderator = Moderator(Blocklist(terms), 3, NearDuplicates(0.8, NEAR_DUPLICATE_WINDOW))
+    mb, ms = throughput(lambda message: moderator.review("guest", message), messages)
+    print(f"{f'review(), {args.terms[-1]} terms':<34} {mb:>8.1f} {ms:>11.2f}")
@@ -0,0 +1,76 @@
+"""Layout and script time in headless Chromium for pages of 1k and 10k cards.
+
+    pip install playwright && playwright install chromium
+    python benchmarks/bench_overflow.py [sizes...]
+
+Compares the page as rendered now (one delegated overflow check in cards.js)
+with the old markup, where every card carried its own inline handler. Times
+come from Chromium's Performance.getMetrics after the page has settled.
+Assets are served straight from assets/; htmx loads from its CDN.
+STORAGE_BACKEND=sqlite avoids needing MONGO_URI.
+"""
+import os
+import sys
+from bson import ObjectId
+from playwright.sync_api import sync_playwright
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+
+DEFAULT_SIZES = (1_000, 10_000)
+ORIGIN = "http://guestbook.bench"
+INLINE_HANDLER = (
+    'class="message-content" hx-on:load="'
+    "if(this.scrollHeight > this.clientHeight) { this.classList.add('scrollable'); }"
+    '"'
+)
+METRICS = ("LayoutCount", "LayoutDuration", "RecalcStyleDuration", "ScriptDuration")
+
+def synthetic_page(count, inline):
+    messages = [
+        {
+            "_id": ObjectId(),
+            "name": f"guest{i}",
+            # Every third card overflows
+            "message": f"Message number {i}. " * (60 if i % 3 == 0 else 3),
+            "created_at": main.utc_now(),
+        }
+        for i in range(count)
+    ]
+    body = "".join(main.to_xml(part) for part in main.render_message_page(messages, None))
+    if inline:
+        body = body.replace('class="message-content"', INLINE_HANDLER)
+    return main.PAGE_HEAD + main.LIST_HEAD + body.encode() + main.LIST_TAIL + main.PAGE_TAIL
+
+def serve_asset(route):
+    names = {url: name for name, url in main.ASSET_URLS.items()}
+    path = route.request.url[len(ORIGIN):]
+    if path in names:
+        return route.fulfill(path=os.path.join(main.ASSETS_DIR, names[path]))
+    return route.fulfill(status=404)
+
+def measure(browser, html):
+    page = browser.new_page()
+    page.route(f"{ORIGIN}/assets/*", serve_asset)
+    page.route(f"{ORIGIN}/", lambda route: route.fulfill(body=html, content_type="text/html"))
+    cdp = page.context.new_cdp_session(page)
+    cdp.send("Performance.enable")
+    page.goto(f"{ORIGIN}/", wait_until="networkidle")
+    # Let the htmx:load handlers and the batched measurement run
+    page.evaluate("new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r)))")
+    metrics = {m["name"]: m["value"] for m in cdp.send("Performance.getMetrics")["metrics"]}
+    scrollable = page.evaluate("document.querySelectorAll('.scrollable').length")
+    page.close()
+    return [metrics[name] for name in METRICS], scrollable
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'cards':>7} {'markup':>9} {'layouts':>8} {'layout ms':>10} {'style ms':>9} {'script ms':>10} {'scrollable':>11}")
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        for count in sizes:
+            for label, inline in (("inline", True), ("delegated", False)):
+                (layouts, layout, style, script), scrollable = measure(browser, synthetic_page(count, inline))
+                print(f"{count:>7} {label:>9} {layouts:>8.0f} {layout * 1000:>10.1f} {style * 1000:>9.1f} {script * 1000:>10.1f} {scrollable:>11}")
+        browser.close()
@@ -0,0 +1,115 @@
+"""Throughput of prefork.py by worker count, and how much worker memory is shared.
+
+    python benchmarks/bench_prefork.py [workers...] [--load-procs 4] [--concurrency 64] [--duration 10]
+
+Starts `prefork.py` on a temporary SQLite guestbook for each worker count and
+drives GET / over HTTP from --load-procs processes running load_test.py's
+closed loop. The load generators share the machine with the workers, so give
+them cores of their own (e.g. with taskset) when measuring scaling; with
+fewer cores than workers plus generators the curve flattens early.
+
+Per-worker RSS is reported next to USS, the part no other process shares:
+what the preloaded, copy-on-write app saves is the difference.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+from load_test import run_level
+from storage import SQLiteStorage
+
+PORT = 5077
+
+def seed(path, count=500):
+    store = SQLiteStorage(path)
+    asyncio.run(store.connect())
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    asyncio.run(store.insert_many([
+        {"name": f"guest{i}", "message": f"Message number {i}. " * 10, "created_at": start + timedelta(seconds=i)}
+        for i in range(count)
+    ]))
+
+def memory_kb(pid):
+    """(RSS, USS) of a process in kB, from /proc."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+def load(url, concurrency, duration, results):
+    results.put(asyncio.run(run_level(url, concurrency, duration)))
+
+def start_server(workers, db_path):
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": db_path, "RATE_LIMIT_PER_MINUTE": "0"}
+    master = subprocess.Popen(
+        [sys.executable, "prefork.py", "--workers", str(workers), "--port", str(PORT), "--host", "127.0.0.1"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{PORT}/healthz/ready").status_code == 200:
+                return master
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    master.kill()
+    raise RuntimeError(f"prefork.py with {workers} workers did not become ready")
+
+def run(workers, args, db_path):
+    master = start_server(workers, db_path)
+    try:
+        results = multiprocessing.Queue()
+        loaders = [
+            multiprocessing.Process(target=load, args=(f"http://127.0.0.1:{PORT}/", args.concurrency, args.duration, results))
+            for _ in range(args.load_procs)
+        ]
+        for loader in loaders:
+            loader.start()
+        levels = [results.get() for _ in loaders]
+        for loader in loaders:
+            loader.join()
+        pids = subprocess.run(["pgrep", "-P", str(master.pid)], capture_output=True, text=True).stdout.split()
+        memory = [memory_kb(int(pid)) for pid in pids]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+    return {
+        "rps": sum(level["rps"] for level in levels),
+        "errors": sum(level["errors"] for level in levels),
+        "p99_ms": max(level["p99_ms"] for level in levels),
+        "rss_mb": sum(rss for rss, _ in memory) / len(memory) / 1024,
+        "uss_mb": sum(uss for _, uss in memory) / len(memory) / 1024,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workers", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--load-procs", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=64, help="connections per load process")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed(db_path)
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'req/s':>9} {'scaling':>8} {'errors':>7} {'p99 ms':>8} {'RSS MB':>7} {'USS MB':>7}")
+    base = None
+    for workers in args.workers:
+        r = run(workers, args, db_path)
+        base = base or r["rps"]
+        print(f"{workers:>8} {r['rps']:>9.1f} {r['rps'] / base:>7.2f}x {r['errors']:>7} {r['p99_ms']:>8.1f} {r['rss_mb']:>7.1f} {r['uss_mb']:>7.1f}")
@@ -0,0 +1,61 @@
+"""Bytes read from the database and peak memory per list request, full documents vs previews.
+
+    python benchmarks/bench_reads.py [--messages 2000] [--mongo-uri URI]
+
+Seeds MAX_MESSAGE_CHAR-length messages into a throwaway store: a temporary
+SQLite file by default, or the `guestbook_bench` database when --mongo-uri is
+given. Bytes are the BSON size of the documents the driver hands back.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import tracemalloc
+import bson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import MongoStorage, SQLiteStorage
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+
+async def measure(store, limit, preview_chars):
+    tracemalloc.start()
+    entries = await store.fetch(limit, preview_chars=preview_chars)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(entries), sum(len(bson.encode(e)) for e in entries), peak
+
+async def seed(store, count):
+    body = "guestbook " * (main.MAX_MESSAGE_CHAR // 10)
+    for start in range(0, count, 500):
+        await store.insert_many([
+            {"name": f"guest{i}", "message": body, "created_at": main.utc_now()}
+            for i in range(start, min(count, start + 500))
+        ])
+
+async def run(args):
+    if args.mongo_uri:
+        store = MongoStorage(args.mongo_uri, "guestbook_bench", "Forks")
+        await store.connect()
+        await store.collection.delete_many({})
+    else:
+        store = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bench.db"))
+        await store.connect()
+    await seed(store, args.messages)
+    print(f"{'read':<28} {'docs':>6} {'bytes from DB':>14} {'peak memory':>12}")
+    cases = [
+        ("whole collection, full", args.messages, None),
+        ("one page, full", main.PAGE_SIZE, None),
+        ("one page, preview", main.PAGE_SIZE, main.PREVIEW_CHARS),
+    ]
+    for label, limit, preview_chars in cases:
+        docs, size, peak = await measure(store, limit, preview_chars)
+        print(f"{label:<28} {docs:>6} {size / 1024:>11.0f} KB {peak / 1024:>9.0f} KB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--mongo-uri")
+    asyncio.run(run(parser.parse_args()))
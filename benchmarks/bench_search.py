@@ -0,0 +1,93 @@
+"""Search latency over a large guestbook: first page and a later page per query.
+
+    python benchmarks/bench_search.py [--messages 1000000] [--runs 50] [--mongo-uri URI]
+
+Seeds messages of Zipf-distributed words into a throwaway store: a temporary
+SQLite file by default, or the `guestbook_bench` database when --mongo-uri is
+given. Seeding goes through insert_many, so the text index is maintained the
+same way it is for submissions.
+
+The backends scale differently: SQLite reads its FTS5 index newest first and
+stops at a page, while MongoDB scores every match before returning the best,
+so its times grow with how common the query's words are.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import MongoStorage, SQLiteStorage
+
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+
+VOCABULARY = [f"word{i}" for i in range(20_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+WORDS_PER_MESSAGE = 20
+QUERIES = {
+    "common word": ["word0"],
+    "mid word": ["word500"],
+    "rare word": ["word19999"],
+    "two words": ["word10", "word200"],
+    "no match": ["nothing"],
+}
+
+async def seed(store, count):
+    rng = random.Random(0)
+    for start in range(0, count, 5000):
+        await store.insert_many([
+            {
+                "name": f"guest{i}",
+                "message": " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=WORDS_PER_MESSAGE)),
+                "created_at": main.utc_now(),
+            }
+            for i in range(start, min(count, start + 5000))
+        ])
+
+async def time_query(store, terms, runs):
+    first, later = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        page = await store.search(terms, main.PAGE_SIZE + 1, preview_chars=main.PREVIEW_CHARS)
+        first.append((time.perf_counter() - start) * 1000)
+        if len(page) > main.PAGE_SIZE:
+            start = time.perf_counter()
+            cursor = store.parse_search_cursor(store.search_cursor(None, page[:main.PAGE_SIZE]))
+            await store.search(terms, main.PAGE_SIZE + 1, cursor, main.PREVIEW_CHARS)
+            later.append((time.perf_counter() - start) * 1000)
+    return first, later
+
+def summary(ms):
+    if not ms:
+        return f"{'-':>8} {'-':>8}"
+    ms = sorted(ms)
+    return f"{statistics.median(ms):>8.2f} {ms[int(len(ms) * 0.99)]:>8.2f}"
+
+async def run(args):
+    if args.mongo_uri:
+        store = MongoStorage(args.mongo_uri, "guestbook_bench", "Forks")
+        await store.connect()
+        await store.collection.delete_many({})
+    else:
+        store = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bench.db"))
+        await store.connect()
+    started = time.perf_counter()
+    await seed(store, args.messages)
+    print(f"seeded {args.messages:,} messages in {time.perf_counter() - started:.1f}s")
+    print(f"{'query':<12} {'page 1 p50':>10} {'p99':>8} {'page 2 p50':>10} {'p99':>8}  (ms)")
+    for label, terms in QUERIES.items():
+        first, later = await time_query(store, terms, args.runs)
+        print(f"{label:<12} {summary(first):>19} {summary(later):>19}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--mongo-uri")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""Cold-start time: process spawn to the first byte of GET / and to /healthz/ready.
+
+    python benchmarks/bench_startup.py [--runs 5] [--port 5099]
+
+Runs `uvicorn main:app` from the repository root with the current environment,
+so set STORAGE_BACKEND / MONGO_URI the same way production does.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wait_for(url, status=200, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == status:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} did not return {status} within {timeout}s")
+
+def measure(port):
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    try:
+        first_byte = wait_for(f"{base}/") - started
+        ready = wait_for(f"{base}/healthz/ready") - started
+    finally:
+        server.terminate()
+        server.wait()
+    return first_byte, ready
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+    results = [measure(args.port) for _ in range(args.runs)]
+    for label, values in zip(("first byte", "db ready"), zip(*results)):
+        ms = [v * 1000 for v in values]
+        print(f"{label:>10}: median {statistics.median(ms):7.1f} ms  min {min(ms):7.1f} ms  max {max(ms):7.1f} ms")
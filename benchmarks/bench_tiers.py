@@ -0,0 +1,117 @@
+"""Storage size and read latency of the hot and cold tiers, with and without compression.
+
+    python benchmarks/bench_tiers.py [--entries 20000] [--large 0.1] [--codec zlib] [--mongo-uri URI]
+
+Seeds a guestbook where a --large fraction of messages are 5,000-50,000
+characters of words and the rest are short, into three stores: uncompressed,
+compressed above STORE_COMPRESS_CHARS, and compressed with the older half
+archived. Sizes come from SQLite's dbstat table (or collStats with
+--mongo-uri); the full-text index is counted with the hot tier. Latencies are
+for a first page of previews, a page deep enough to be served by the cold tier
+when there is one, and get() of large entries in each tier.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import MongoStorage, SQLiteStorage
+
+PAGE_SIZE = 24
+PREVIEW_CHARS = 1000
+STORE_COMPRESS_CHARS = 4000
+SAMPLES = 300
+
+def make_entries(count, large, rng):
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(3000)]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    entries = []
+    for i in range(count):
+        length = rng.randint(5_000, 50_000) if rng.random() < large else rng.randint(20, 300)
+        words = rng.choices(vocabulary, k=length // 5 + 1)
+        entries.append({"name": f"guest{i % 1000}", "message": " ".join(words)[:length], "created_at": start + timedelta(minutes=i)})
+    return entries
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6
+
+async def timed(call, arguments):
+    samples = []
+    for args in arguments:
+        start = time.perf_counter()
+        await call(*args)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+async def measure(store, entries, archive_before):
+    await store.insert_many([dict(entry) for entry in entries])
+    if archive_before is not None:
+        while await store.archive(archive_before, 1000):
+            pass
+    stats = await store.tier_stats()
+    # Keys of the newest entries in the older half, so pages there come from the cold tier if there is one
+    ordered = await store.fetch(len(entries), preview_chars=PREVIEW_CHARS)
+    deep = ordered[len(entries) // 2 + PAGE_SIZE:]
+    large = [entry["_id"] for entry in ordered if entry["truncated"]]
+    rng = random.Random(2)
+    latencies = {
+        "first page": await timed(store.fetch, [(PAGE_SIZE, None, PREVIEW_CHARS)] * SAMPLES),
+        "deep page": await timed(store.fetch, [
+            (PAGE_SIZE, (entry["created_at"], entry["_id"]), PREVIEW_CHARS) for entry in rng.choices(deep, k=SAMPLES)
+        ]),
+        "get large, newer half": await timed(store.get, [(rng.choice(large[:len(large) // 2]),) for _ in range(SAMPLES)]),
+        "get large, older half": await timed(store.get, [(rng.choice(large[len(large) // 2:]),) for _ in range(SAMPLES)]),
+    }
+    return stats, latencies
+
+def make_store(args, name, compress_chars):
+    if args.mongo_uri:
+        return MongoStorage(args.mongo_uri, "guestbook_bench", name, compress_chars=compress_chars, head_chars=PREVIEW_CHARS, codec=args.codec)
+    path = os.path.join(tempfile.mkdtemp(), f"{name}.db")
+    return SQLiteStorage(path, compress_chars=compress_chars, head_chars=PREVIEW_CHARS, codec=args.codec)
+
+async def main(args):
+    entries = make_entries(args.entries, args.large, random.Random(1))
+    raw_mb = sum(len(entry["message"]) for entry in entries) / 1e6
+    print(f"{args.entries} entries, {raw_mb:.1f} MB of message text, codec {args.codec}")
+    middle = entries[len(entries) // 2]["created_at"]
+    configurations = [
+        ("plain", 0, None),
+        ("compressed", STORE_COMPRESS_CHARS, None),
+        ("archived", STORE_COMPRESS_CHARS, middle),
+    ]
+    print(f"{'store':<11} {'tier':<5} {'entries':>8} {'data MB':>8} {'index MB':>9}")
+    results = {}
+    for name, compress_chars, archive_before in configurations:
+        store = make_store(args, f"tiers_{name}", compress_chars)
+        await store.connect()
+        if args.mongo_uri:
+            await store.collection.drop()
+            await store.cold.drop()
+            await store.connect()
+        stats, results[name] = await measure(store, entries, archive_before)
+        for tier, tier_stats in stats.items():
+            print(f"{name:<11} {tier:<5} {tier_stats['entries']:>8} {tier_stats['data_bytes'] / 1e6:>8.2f} {tier_stats['index_bytes'] / 1e6:>9.2f}")
+        if args.mongo_uri:
+            await store.collection.drop()
+            await store.cold.drop()
+    print()
+    print(f"{'read':<24}" + "".join(f" {name + ' p50/p99 µs':>25}" for name, _, _ in configurations))
+    for read in results["plain"]:
+        print(f"{read:<24}" + "".join(f" {results[name][read][0]:>12.0f}/{results[name][read][1]:<12.0f}" for name, _, _ in configurations))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20_000)
+    parser.add_argument("--large", type=float, default=0.1, help="fraction of 5k-50k character messages")
+    parser.add_argument("--codec", default="zlib", choices=["zlib", "zstd"])
+    parser.add_argument("--mongo-uri")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+"""Export and import throughput of transfer.py, and its peak memory, by guestbook size.
+
+    python benchmarks/bench_transfer.py [sizes...] [--formats ndjson gz zst]
+
+Runs `transfer.py export` and `transfer.py import` as child processes against
+temporary SQLite databases and reports docs/sec and the child's peak RSS.
+Process startup (importing main) is measured on an empty database and taken
+out of the rates; flat RSS across sizes is what constant memory looks like.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from storage import SQLiteStorage, to_millis
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+def seed(path, count, batch=10_000):
+    store = SQLiteStorage(path)
+    asyncio.run(store.connect())
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, count, batch):
+        rows = [
+            (f"guest{i % 1000}", f"Message number {i}, hello from the benchmark! " * 3, to_millis(start + timedelta(seconds=i)))
+            for i in range(offset, min(count, offset + batch))
+        ]
+        with store.db.conn:
+            store.db.conn.executemany("INSERT INTO messages (name, message, created_at) VALUES (?, ?, ?)", rows)
+
+def run(db_path, *args):
+    """Run transfer.py; returns (seconds, peak RSS in MB)."""
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": db_path, "METRICS": "0"}
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, "transfer.py", *args], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(child.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status:
+        raise RuntimeError(f"transfer.py {' '.join(args)} failed")
+    return elapsed, usage.ru_maxrss / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sizes", type=int, nargs="*", default=DEFAULT_SIZES)
+    parser.add_argument("--formats", nargs="+", default=["ndjson", "gz", "zst"])
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    empty = os.path.join(workdir, "empty.db")
+    startup, base_rss = run(empty, "export", os.path.join(workdir, "empty.ndjson"))
+    print(f"startup {startup:.2f}s, {base_rss:.0f} MB RSS with no entries")
+    print(f"{'entries':>9} {'format':>7} {'MB':>8} {'export/s':>10} {'RSS MB':>7} {'import/s':>10} {'RSS MB':>7}")
+    for size in args.sizes:
+        source = os.path.join(workdir, f"source-{size}.db")
+        seed(source, size)
+        for fmt in args.formats:
+            dump = os.path.join(workdir, f"dump-{size}.ndjson" + ("" if fmt == "ndjson" else f".{fmt}"))
+            export_s, export_rss = run(source, "export", dump)
+            target = os.path.join(workdir, f"target-{size}-{fmt}.db")
+            import_s, import_rss = run(target, "import", dump)
+            print(
+                f"{size:>9} {fmt:>7} {os.path.getsize(dump) / 1e6:>8.1f}"
+                f" {size / max(export_s - startup, 1e-3):>10,.0f} {export_rss:>7.0f}"
+                f" {size / max(import_s - startup, 1e-3):>10,.0f} {import_rss:>7.0f}"
+            )
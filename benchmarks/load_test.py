@@ -0,0 +1,63 @@
+"""Closed-loop HTTP load test against a running guestbook.
+
+    python benchmarks/load_test.py [--url URL] [--path /] [--concurrency 50 200 1000] [--duration 10]
+
+Start the server first (e.g. `uvicorn main:app --port 5001`). To compare the
+async handlers with the old threadpool-bound ones, run this once against each
+checkout and compare the tables.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+async def client_loop(client, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+async def run_level(url, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors = [], []
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await client.get(url)  # warm up caches and the connection pool
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client_loop(client, url, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+async def main(args):
+    url = args.url.rstrip("/") + args.path
+    print(f"{'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        r = await run_level(url, concurrency, args.duration)
+        print(f"{r['concurrency']:>8} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duration", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
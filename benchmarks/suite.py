@@ -0,0 +1,219 @@
+"""Benchmark suite: GET / and POST /submit-message in-process, as JSON for comparing commits.
+
+    python benchmarks/suite.py [--sizes 1000 10000 100000] [--lengths short long] [--out results.json]
+    python benchmarks/suite.py --compare before.json after.json
+
+Every (guestbook size, message length) pair runs in a fresh process: it seeds
+a throwaway store, starts the app's startup handlers, then drives the ASGI app
+directly (no sockets, no HTTP client) from --concurrency tasks. "short"
+messages are about 60 characters and "long" ones MAX_MESSAGE_CHAR; long runs
+stop at --long-max messages to keep seeding time sane. The store is a
+temporary SQLite file, or the `guestbook_bench` database on a local mongod
+when --mongo-uri is given (it is dropped afterwards).
+
+Each result has throughput, p50/p99 latency, mean response bytes (requests
+ask for br/gzip like a browser) and the child's peak RSS, measured after
+seeding and after the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+SEED_BATCH = 1_000
+WORDS = "the quick brown fox jumps over a lazy dog while guests leave kind notes".split()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def make_text(i, length):
+    words = (WORDS[(i + n) % len(WORDS)] for n in range(length // 4 + 1))
+    return f"#{i} " + " ".join(words)[:length]
+
+def scope(method, path, headers):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+async def request(app, method, path, headers=(), body=b""):
+    """Send one request through the ASGI app; returns (status, response body bytes, headers)."""
+    response = {"status": 0, "bytes": 0, "headers": {}}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            response["bytes"] += len(message.get("body", b""))
+    await app(scope(method, path, [(b"host", b"bench"), (b"accept-encoding", b"br, gzip"), *headers]), receive, send)
+    return response["status"], response["bytes"], response["headers"]
+
+async def drive(name, count, concurrency, make_request):
+    latencies, sizes, errors = [], [], 0
+    counter = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            status, size, headers = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(size)
+            # Form errors are 200s that htmx retargets to the form
+            errors += status >= 400 or b"hx-retarget" in headers
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "route": name,
+        "requests": count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "bytes_per_response": round(sum(sizes) / len(sizes)),
+    }
+
+async def child(spec):
+    import main
+    backend = getattr(main.storage, "backend", main.storage)
+    if spec["mongo_uri"]:
+        backend.db_name = "guestbook_bench"
+    length = main.MAX_MESSAGE_CHAR if spec["length"] == "long" else 60
+    await main.storage.connect()
+    start = datetime.now(timezone.utc) - timedelta(seconds=spec["messages"])
+    for offset in range(0, spec["messages"], SEED_BATCH):
+        await main.storage.insert_many([
+            {"name": f"guest{i % 1000}", "message": make_text(i, length), "created_at": start + timedelta(seconds=i)}
+            for i in range(offset, min(spec["messages"], offset + SEED_BATCH))
+        ])
+    seeded_rss = peak_rss_mb()
+    await main.app.router.startup()
+    while not main.db_status["ready"]:
+        await asyncio.sleep(0.01)
+
+    async def get_page(i):
+        return await request(main.app, "GET", "/")
+
+    async def submit(i):
+        body = urlencode({"name": f"bench{i % 100}", "message": make_text(spec["messages"] + i, length)}).encode()
+        headers = [(b"content-type", b"application/x-www-form-urlencoded"), (b"hx-request", b"true")]
+        return await request(main.app, "POST", "/submit-message", headers, body)
+
+    await get_page(0)  # warm the caches
+    results = [
+        await drive("GET /", spec["requests"], spec["concurrency"], get_page),
+        await drive("POST /submit-message", spec["posts"], spec["concurrency"], submit),
+    ]
+    await main.app.router.shutdown()
+    if spec["mongo_uri"]:
+        await backend.client.drop_database("guestbook_bench")
+    for result in results:
+        result.update(messages=spec["messages"], length=spec["length"], seed_rss_mb=round(seeded_rss, 1),
+                      peak_rss_mb=round(peak_rss_mb(), 1))
+    print(json.dumps(results))
+
+def run_child(spec):
+    env = {
+        **os.environ,
+        "BENCH_SPEC": json.dumps(spec),
+        # Every POST must reach the database. The bodies are rotations of one
+        # word list, which the near-duplicate check would reject; the rest of
+        # moderation stays in the timed path
+        "RATE_LIMIT_PER_MINUTE": "0",
+        "DEDUPE_WINDOW": "0",
+        "NEAR_DUPLICATE_THRESHOLD": "0",
+    }
+    if spec["mongo_uri"]:
+        env.update(STORAGE_BACKEND="mongo", MONGO_URI=spec["mongo_uri"])
+    else:
+        env.update(STORAGE_BACKEND="sqlite", SQLITE_PATH=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    out = subprocess.run([sys.executable, __file__], env=env, cwd=ROOT, capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(f"Benchmark run {spec} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = {(r["messages"], r["length"], r["route"]): r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = json.load(f)["results"]
+    print(f"{'messages':>9} {'length':>6} {'route':<22} {'req/s':>9} {'change':>8} {'p99 ms':>8} {'change':>8}")
+    for r in after:
+        old = before.get((r["messages"], r["length"], r["route"]))
+        if old is None:
+            continue
+        rps = (r["throughput_rps"] / old["throughput_rps"] - 1) * 100
+        p99 = (r["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0.0
+        print(f"{r['messages']:>9} {r['length']:>6} {r['route']:<22} {r['throughput_rps']:>9.1f} {rps:>+7.1f}% {r['p99_ms']:>8.2f} {p99:>+7.1f}%")
+
+if __name__ == "__main__":
+    if os.environ.get("BENCH_SPEC"):
+        sys.path.insert(0, ROOT)
+        asyncio.run(child(json.loads(os.environ["BENCH_SPEC"])))
+        os._exit(0)  # skip waiting on background tasks
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--lengths", nargs="+", choices=("short", "long"), default=["short", "long"])
+    parser.add_argument("--long-max", type=int, default=10_000, help="largest guestbook seeded with long messages")
+    parser.add_argument("--requests", type=int, default=2000, help="GET / requests per run")
+    parser.add_argument("--posts", type=int, default=500, help="POST /submit-message requests per run")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of SQLite")
+    parser.add_argument("--out", help="write the JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="print the change between two results files")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    results = []
+    for length in args.lengths:
+        for size in args.sizes:
+            if length == "long" and size > args.long_max:
+                continue
+            spec = {"messages": size, "length": length, "requests": args.requests, "posts": args.posts,
+                    "concurrency": args.concurrency, "mongo_uri": args.mongo_uri}
+            print(f"{size} {length} messages...", file=sys.stderr)
+            results += run_child(spec)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "backend": "mongo" if args.mongo_uri else "sqlite",
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
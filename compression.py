@@ -0,0 +1,165 @@
+"""Response compression: brotli or gzip, negotiated from Accept-Encoding.
+
+Dynamic responses are compressed by `CompressionMiddleware`. Static assets are
+compressed once ahead of time by `precompress()` (run `python compression.py`
+as a build step) and picked by `negotiate_file()` at request time.
+"""
+import gzip
+import os
+import sys
+import zlib
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+# Content types worth compressing; images other than icons are already compressed
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+)
+# Event streams stay uncompressed: a compressor per idle connection costs too much memory
+NEVER_COMPRESS = ("text/event-stream",)
+PRECOMPRESS_EXCLUDE = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".br", ".gz"}
+
+def accepted_encodings(header):
+    """Encodings the client accepts with a non-zero q-value."""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name, params = name.strip().lower(), params.strip()
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+def pick_encoding(header):
+    accepted = accepted_encodings(header)
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+class Compressor:
+    """Streaming compressor; `compress()` returns bytes that can be sent immediately."""
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data, final=False):
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """Compress compressible responses of at least `minimum_size` bytes.
+
+    Streaming bodies are flushed chunk by chunk, so streamed HTML still reaches
+    the browser as it is produced. Responses that already carry a
+    Content-Encoding (pre-compressed assets) pass through untouched.
+    """
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                skip = (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(NEVER_COMPRESS)
+                    or (not more_body and len(body) < self.minimum_size)
+                )
+                if not skip:
+                    compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    del headers["Content-Length"]
+                    if not more_body:
+                        body = compressor.compress(body, final=True)
+                        headers["Content-Length"] = str(len(body))
+                        compressor = None
+                        message = {**message, "body": body}
+                elif content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(NEVER_COMPRESS):
+                    headers.add_vary_header("Accept-Encoding")
+                await send(start)
+                start = None
+            if compressor is not None:
+                message = {**message, "body": compressor.compress(body, final=not more_body)}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+def negotiate_file(path, accept_encoding, variants):
+    """Return (path, encoding) for the best pre-compressed variant of `path`."""
+    for encoding in ("br", "gzip"):
+        if encoding in variants and encoding in accepted_encodings(accept_encoding):
+            return variants[encoding], encoding
+    return path, None
+
+def find_variants(path):
+    """Pre-compressed siblings of `path` that are at least as new as the original."""
+    variants = {}
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        candidate = path + suffix
+        if os.path.exists(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(path):
+            variants[encoding] = candidate
+    return variants
+
+def precompress(directory):
+    """Write maximum-effort .br and .gz files next to every compressible file."""
+    written = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path) or os.path.splitext(name)[1].lower() in PRECOMPRESS_EXCLUDE:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        for suffix, compressed in (
+            (".br", brotli.compress(data, quality=11)),
+            (".gz", gzip.compress(data, compresslevel=9, mtime=0)),
+        ):
+            # Only keep a variant that is actually smaller
+            if len(compressed) < len(data):
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+                written.append((path + suffix, len(data), len(compressed)))
+    return written
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+    for path, original, compressed in precompress(directory):
+        print(f"{path}: {original} -> {compressed} bytes")
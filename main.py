@@ -1,9 +1,24 @@
 import os
-from datetime import datetime
+import asyncio
+import hashlib
+import importlib.util
+import mimetypes
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 import pytz
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from fasthtml.common import *
+from starlette.responses import StreamingResponse
+from compression import CompressionMiddleware, find_variants, negotiate_file
+from metrics import BYTES_BUCKETS, COUNT_BUCKETS, MetricsMiddleware, Registry, TimedStorage
+from moderation import Blocklist, Moderator, NearDuplicates, load_blocklist
+from ratelimit import DuplicateFilter, MemoryBuckets, RateLimitMiddleware, SQLiteBuckets
+from storage import APPROVED, PENDING, MongoStorage, SQLiteStorage
 
 # Load environment variables
 load_dotenv()
@@ -11,135 +26,920 @@ load_dotenv()
 MAX_NAME_CHAR = 15
 MAX_MESSAGE_CHAR = 50000
 TIMESTAMP_FMT = "%Y-%m-%d %I:%M:%S %p %Z"
+LEGACY_PARSE_FMT = "%Y-%m-%d %I:%M:%S %p"
+IST = pytz.timezone("Asia/Kolkata")
+PAGE_SIZE = 24
+# Cards show at most this many characters; the rest loads from /message/{id}
+PREVIEW_CHARS = int(os.getenv("PREVIEW_CHARS", 1000))
 
-# MongoDB connection
-mongo_client = MongoClient(os.getenv("MONGO_URI"))
-db = mongo_client['sujalkiguestbook']
-collection = db['Forks']
+# Words after this many are ignored in a search query
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", 8))
+# MongoDB ranks every match, and pages through at most this many of the best
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 1000))
+
+# Streaming mode: GET / sends the page shell at once, then cards as they are read
+STREAM_HTML = os.getenv("STREAM_HTML", "0") == "1"
+STREAM_PAGE_SIZE = int(os.getenv("STREAM_PAGE_SIZE", 200))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 50))
+
+# How long a shared cache (CDN) may serve the page before revalidating
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", 5))
+
+# Response compression; bodies smaller than COMPRESS_MIN_SIZE are sent as-is
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 500))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+# In-process cache of the newest messages
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", 240))
+MESSAGE_CACHE_TTL = float(os.getenv("MESSAGE_CACHE_TTL", 60))
+MESSAGE_CACHE_POLL = float(os.getenv("MESSAGE_CACHE_POLL", 2))
+
+# Above this many messages the browser mounts only the cards near the viewport;
+# 0 turns the windowed grid off
+VIRTUAL_GRID_THRESHOLD = int(os.getenv("VIRTUAL_GRID_THRESHOLD", 0))
+VIRTUAL_CHUNK_SIZE = int(os.getenv("VIRTUAL_CHUNK_SIZE", 48))
+# The stored message count it is compared with is recounted this often (seconds)
+MESSAGE_COUNT_INTERVAL = float(os.getenv("MESSAGE_COUNT_INTERVAL", 60))
+
+# Rendered message cards, keyed by _id
+FRAGMENT_CACHE_BYTES = int(os.getenv("FRAGMENT_CACHE_BYTES", 16 * 1024 * 1024))
+
+# Submissions per client IP: RATE_LIMIT_PER_MINUTE on average, bursts of up to
+# RATE_LIMIT_BURST; 0 turns the limit off. The "sqlite" backend shares buckets
+# between the workers on a host through RATE_LIMIT_PATH.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", 10))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 5))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "ratelimit.db")
+# Take the client IP from X-Forwarded-For; only safe behind a proxy that sets it
+TRUST_PROXY = os.getenv("TRUST_PROXY", "0") == "1"
+# Identical name+message submissions within this many seconds are dropped
+DEDUPE_WINDOW = float(os.getenv("DEDUPE_WINDOW", 30))
+
+# Moderation: blocked words from BLOCKLIST_PATH (one per line), more than
+# MAX_LINKS links, or near-copies of the last NEAR_DUPLICATE_WINDOW messages are
+# refused. Messages up to MODERATION_INLINE_CHARS are checked before the reply;
+# longer ones are stored pending and checked on MODERATION_THREADS threads.
+MODERATION = os.getenv("MODERATION", "1") == "1"
+BLOCKLIST_PATH = os.getenv("BLOCKLIST_PATH", "blocklist.txt")
+MAX_LINKS = int(os.getenv("MAX_LINKS", 3))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.8))
+NEAR_DUPLICATE_WINDOW = int(os.getenv("NEAR_DUPLICATE_WINDOW", 1000))
+MODERATION_INLINE_CHARS = int(os.getenv("MODERATION_INLINE_CHARS", 2000))
+MODERATION_THREADS = int(os.getenv("MODERATION_THREADS", 2))
+
+# Live feed of new cards over server-sent events at /events. Other workers'
+# writes arrive through the newest-id poll, or at once with EVENTS_CHANGE_STREAM=1
+# (MongoDB replica sets only).
+LIVE_EVENTS = os.getenv("LIVE_EVENTS", "1") == "1"
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", 32))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", 15))
+EVENTS_POLL_BATCH = int(os.getenv("EVENTS_POLL_BATCH", 100))
+EVENTS_CHANGE_STREAM = os.getenv("EVENTS_CHANGE_STREAM", "0") == "1"
+
+# Optional write-behind queue for submissions
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 100))
+WRITE_FLUSH_MS = float(os.getenv("WRITE_FLUSH_MS", 50))
+WRITE_QUEUE_MAX = int(os.getenv("WRITE_QUEUE_MAX", 10000))
+# A batch that fails is retried after WRITE_RETRY_MS, doubling each time
+WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", 3))
+WRITE_RETRY_MS = float(os.getenv("WRITE_RETRY_MS", 100))
+
+# Prometheus metrics at /metrics
+METRICS = os.getenv("METRICS", "1") == "1"
+
+# Storage backend: "mongo" (default) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "guestbook.db")
+
+# Messages longer than STORE_COMPRESS_CHARS (0, the default, disables it) are
+# stored compressed with STORE_CODEC, "zlib" or "zstd" (needs the zstandard
+# package), behind an uncompressed head of PREVIEW_CHARS. Search only matches
+# within that head, so turning this on trades search coverage for space
+STORE_COMPRESS_CHARS = int(os.getenv("STORE_COMPRESS_CHARS", 0))
+STORE_CODEC = os.getenv("STORE_CODEC", "zlib")
+if STORE_CODEC == "zstd" and importlib.util.find_spec("zstandard") is None:
+    print("STORE_CODEC=zstd needs the zstandard package; using zlib")
+    STORE_CODEC = "zlib"
+
+# Entries older than ARCHIVE_AFTER_DAYS (0 to disable) move to the cold tier,
+# ARCHIVE_BATCH_SIZE at a time, every ARCHIVE_INTERVAL seconds
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", 0))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))
+
+# MongoDB connection pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+
+# The server starts without waiting for the database and connects in the background
+DB_CONNECT_TIMEOUT_MS = int(os.getenv("DB_CONNECT_TIMEOUT_MS", 2000))
+DB_RETRY_INTERVAL = float(os.getenv("DB_RETRY_INTERVAL", 5))
+
+def make_storage():
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_PATH, compress_chars=STORE_COMPRESS_CHARS, head_chars=PREVIEW_CHARS, codec=STORE_CODEC)
+    if STORAGE_BACKEND == "mongo":
+        if not os.getenv("MONGO_URI"):
+            raise EnvironmentError("Missing required environment variable: MONGO_URI")
+        return MongoStorage(
+            os.getenv("MONGO_URI"),
+            'sujalkiguestbook',
+            'Forks',
+            max_pool_size=MONGO_MAX_POOL_SIZE,
+            min_pool_size=MONGO_MIN_POOL_SIZE,
+            timeout_ms=DB_CONNECT_TIMEOUT_MS,
+            compress_chars=STORE_COMPRESS_CHARS,
+            head_chars=PREVIEW_CHARS,
+            codec=STORE_CODEC,
+            search_max_results=SEARCH_MAX_RESULTS,
+        )
+    raise EnvironmentError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+registry = Registry("guestbook")
+request_seconds = registry.histogram("http_request_duration_seconds", "Request latency by route", labels=("route",))
+db_seconds = registry.histogram("db_operation_duration_seconds", "Storage call latency by method", labels=("operation",))
+render_seconds = registry.histogram(
+    "render_duration_seconds", "Message list render time: build is the tree, serialize is to_xml", labels=("stage",)
+)
+rendered_bytes = registry.histogram("rendered_bytes", "Size of the rendered message list", buckets=BYTES_BUCKETS)
+page_messages = registry.histogram("messages_per_page", "Messages in each page served", buckets=COUNT_BUCKETS)
+
+storage = TimedStorage(make_storage(), db_seconds) if METRICS else make_storage()
+db_status = {"ready": False, "error": None}
+
+def make_buckets():
+    rate = RATE_LIMIT_PER_MINUTE / 60
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBuckets(rate, RATE_LIMIT_BURST)
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBuckets(RATE_LIMIT_PATH, rate, RATE_LIMIT_BURST)
+    raise EnvironmentError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+
+duplicates = DuplicateFilter(DEDUPE_WINDOW)
+moderator = Moderator(
+    Blocklist(load_blocklist(BLOCKLIST_PATH)),
+    MAX_LINKS,
+    NearDuplicates(NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_WINDOW) if NEAR_DUPLICATE_THRESHOLD > 0 else None,
+) if MODERATION else None
+# Threads are started on first use, so a prefork master forks none
+moderation_pool = ThreadPoolExecutor(MODERATION_THREADS, thread_name_prefix="moderation") if MODERATION else None
+MODERATION_REASONS = {
+    "blocked_word": "contains a word that is not allowed",
+    "too_many_links": f"has more than {MAX_LINKS} links",
+    "near_duplicate": "repeats a recent message",
+}
+
+# Static assets, served under content-hashed URLs so browsers can cache them forever
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The favicon keeps its plain URL, so it may only be cached for a while
+ICON_CACHE_CONTROL = "public, max-age=86400"
+
+def fingerprint(filename):
+    with open(os.path.join(ASSETS_DIR, filename), "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem, ext = os.path.splitext(filename)
+    return f"/assets/{stem}.{digest}{ext}"
+
+ASSET_URLS = {name: fingerprint(name) for name in ("guestbook.css", "theme.js", "cards.js", "virtual.js", "live.js")}
 
 # Create app with a favicon link
 app, rt = fast_app(
     hdrs=(
         Link(rel='icon', type='image/favicon.ico', href="/assets/me.ico"),
+        Link(rel='stylesheet', href=ASSET_URLS["guestbook.css"]),
+        Script(src=ASSET_URLS["theme.js"]),
+        Script(src=ASSET_URLS["cards.js"]),
+        Script(src=ASSET_URLS["virtual.js"]),
+        *([Script(src=ASSET_URLS["live.js"])] if LIVE_EVENTS else []),
         Link(rel='preconnect', href="https://fonts.googleapis.com"),
         Link(rel='preconnect', href="https://fonts.gstatic.com", crossorigin=""),
         Link(rel='stylesheet', href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap"),
         Link(rel='stylesheet', href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css"),
-    )
+    ),
+    middleware=[
+        Middleware(
+            CompressionMiddleware,
+            minimum_size=COMPRESS_MIN_SIZE,
+            gzip_level=GZIP_LEVEL,
+            brotli_quality=BROTLI_QUALITY,
+        ),
+        *([Middleware(
+            RateLimitMiddleware,
+            buckets=make_buckets(),
+            paths=["/submit-message"],
+            trust_forwarded=TRUST_PROXY,
+        )] if RATE_LIMIT_PER_MINUTE > 0 else []),
+    ],
 )
 
-def get_ist_time():
-    ist_tz = pytz.timezone("Asia/Kolkata")
-    return datetime.now(ist_tz)
+def utc_now():
+    # BSON datetimes only keep milliseconds, so match that precision up front
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def as_utc(dt):
+    # pymongo hands back naive datetimes that are implicitly UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def format_timestamp(entry):
+    created_at = entry.get('created_at')
+    if created_at is None:
+        # Legacy entries that have not been backfilled yet
+        return entry.get('timestamp', 'Unknown time')
+    return as_utc(created_at).astimezone(IST).strftime(TIMESTAMP_FMT)
+
+def parse_legacy_timestamp(value):
+    """Parse a display string written with TIMESTAMP_FMT back into a UTC datetime."""
+    # strptime cannot read the "IST" abbreviation, so drop it and localize instead
+    naive = datetime.strptime(value.rsplit(" ", 1)[0], LEGACY_PARSE_FMT)
+    return IST.localize(naive).astimezone(timezone.utc)
 
-def add_message(name, message):
+def make_preview(entry):
+    """Copy of a full entry shaped like the previews storage.fetch() returns."""
+    message = entry["message"]
+    return {**entry, "message": message[:PREVIEW_CHARS], "truncated": len(message) > PREVIEW_CHARS}
+
+async def add_message(name, message):
     if not name or not message:
         raise ValueError("Name and message cannot be empty")
     
     name = name.strip()[:MAX_NAME_CHAR]
     message = message.strip()[:MAX_MESSAGE_CHAR]
     
-    timestamp = get_ist_time().strftime(TIMESTAMP_FMT)
+    if not db_status["ready"]:
+        raise RuntimeError("Database is not ready yet")
+    key = DuplicateFilter.key(name, message)
+    if not duplicates.check(key):
+        raise ValueError("This message was just posted")
+    entry = {"name": name, "message": message, "created_at": utc_now()}
+    if moderator is not None:
+        if len(message) > MODERATION_INLINE_CHARS:
+            return await add_pending(entry, key)
+        reason = moderator.review(name, message)
+        if reason:
+            raise ValueError(f"This message {MODERATION_REASONS[reason]}")
+        entry["status"] = APPROVED
     try:
-        collection.insert_one(
-            {"name": name, "message": message, "timestamp": timestamp}
-        )
+        if write_queue is not None:
+            # The entry reaches message_cache when its batch is flushed; its _id
+            # is assigned up front, so the card matches the live event for it
+            entry["_id"] = storage.new_id()
+            await write_queue.put(entry)
+            return make_preview(entry)
+        await storage.insert(entry)
+    except Exception as e:
+        print(f"Database error: {e}")
+        duplicates.forget(key)
+        raise
+    preview = make_preview(entry)
+    message_cache.add(preview)
+    newest["id"] = entry["_id"]
+    message_count["total"] += 1
+    broadcaster.publish(preview)
+    return preview
+
+async def add_pending(entry, key):
+    # Stored hidden and reviewed off the event loop; only the poster sees the card until then
+    entry["status"] = PENDING
+    try:
+        await storage.insert(entry)
     except Exception as e:
         print(f"Database error: {e}")
+        duplicates.forget(key)
         raise
+    start_background(moderate(entry))
+    return make_preview(entry)
 
-def get_messages():
+async def moderate(entry):
+    """Review a pending entry in moderation_pool, then publish it or delete it."""
     try:
-        messages = list(collection.find().sort("timestamp", -1))
-        return messages
+        reason = await asyncio.get_running_loop().run_in_executor(
+            moderation_pool, moderator.review, entry["name"], entry["message"]
+        )
+        if reason:
+            if await storage.reject(entry["_id"]):
+                print(f"Rejected message {entry['_id']}: {reason}")
+            # So that the poster can send an edited message
+            duplicates.forget(DuplicateFilter.key(entry["name"], entry["message"]))
+            return
+        # Dated by its approval, so it lands on top and moves the newest id
+        entry["created_at"] = utc_now()
+        if not await storage.approve(entry["_id"], entry["created_at"]):
+            # Every worker reviews leftover pending entries; another got here first
+            return
+    except Exception as e:
+        # Left pending; connect_db() reviews pending entries again on startup
+        print(f"Moderation error for {entry['_id']}: {e}")
+        return
+    entry["status"] = APPROVED
+    preview = make_preview(entry)
+    fragment_cache.put(str(entry["_id"]), to_xml(render_message(preview)))
+    message_cache.add(preview)
+    newest["id"] = entry["_id"]
+    message_count["total"] += 1
+    broadcaster.publish(preview)
+
+async def review_pending():
+    # Entries left pending when a previous process stopped, a batch at a time and
+    # in _id order, so one that fails review again is not fetched again
+    after = None
+    while True:
+        try:
+            batch = await storage.pending(EVENTS_POLL_BATCH, after)
+        except Exception as e:
+            print(f"Error fetching pending messages: {e}")
+            return
+        if not batch:
+            return
+        await asyncio.gather(*(moderate(entry) for entry in batch))
+        after = batch[-1]["_id"]
+
+def encode_cursor(entry):
+    created_at = entry.get("created_at")
+    millis = int(as_utc(created_at).timestamp() * 1000) if created_at else ""
+    return f"{millis}-{entry['_id']}"
+
+def decode_cursor(cursor):
+    try:
+        millis, entry_id = cursor.split("-", 1)
+        created_at = datetime.fromtimestamp(int(millis) / 1000, timezone.utc) if millis else None
+        return created_at, storage.parse_id(entry_id)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        raise ValueError("Invalid cursor")
+
+async def query_messages(limit, before_cursor=None):
+    before = decode_cursor(before_cursor) if before_cursor else None
+    # Fetch one extra document to know whether another page exists
+    messages = await storage.fetch(limit + 1, before, preview_chars=PREVIEW_CHARS)
+    if len(messages) > limit:
+        messages = messages[:limit]
+        return messages, encode_cursor(messages[-1])
+    return messages, None
+
+class MessageCache:
+    """Newest-first window of the guestbook, kept current by add_message().
+
+    Entries expire after `ttl` seconds; `watch_newest()` additionally polls the
+    newest _id so that writes made by other workers invalidate this copy quickly.
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None
+        self._positions = {}
+        self._complete = False
+        self._expires = 0.0
+
+    def _index(self):
+        self._positions = {encode_cursor(e): i for i, e in enumerate(self._entries)}
+
+    def get_page(self, limit, before_cursor=None):
+        with self._lock:
+            if self._entries is not None and time.monotonic() < self._expires:
+                start = 0
+                if before_cursor is not None:
+                    position = self._positions.get(before_cursor)
+                    start = None if position is None else position + 1
+                if start is not None:
+                    end = start + limit
+                    if end <= len(self._entries) or self._complete:
+                        self.hits += 1
+                        page = self._entries[start:end]
+                        more = end < len(self._entries) or not self._complete
+                        return page, encode_cursor(page[-1]) if page and more else None
+            self.misses += 1
+            return None
+
+    def load(self, messages, complete):
+        with self._lock:
+            self._entries = messages
+            self._complete = complete
+            self._expires = time.monotonic() + self.ttl
+            self._index()
+
+    def add(self, entry):
+        with self._lock:
+            if self._entries is None:
+                return
+            self._entries = [entry] + self._entries
+            if len(self._entries) > self.size:
+                self._entries = self._entries[:self.size]
+                self._complete = False
+            self._index()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+            self._positions = {}
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries) if self._entries is not None else 0
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+message_cache = MessageCache(MESSAGE_CACHE_SIZE, MESSAGE_CACHE_TTL)
+
+class Broadcaster:
+    """Fan new cards out to every connected /events client.
+
+    Each card is rendered and encoded once, then put on every client's queue.
+    Queues hold at most `buffer_size` events; a client that falls that far
+    behind is disconnected instead of buffering without bound, and its
+    EventSource reconnects. Entries are published at most once, however many
+    feeds (local writes, polling, change stream) report them.
+    """
+    def __init__(self, buffer_size, remember=1000):
+        self.buffer_size = buffer_size
+        self.remember = remember
+        self.clients = set()
+        self.recent = OrderedDict()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.buffer_size)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.discard(queue)
+
+    def publish(self, entry):
+        key = str(entry.get("_id", ""))
+        if not key or key in self.recent or not self.clients:
+            return
+        self.recent[key] = True
+        if len(self.recent) > self.remember:
+            self.recent.popitem(last=False)
+        html = str(render_message_html(entry))
+        data = "".join(f"data: {line}\n" for line in html.splitlines())
+        self.published += 1
+        self.send(f"id: {key}\n{data}\n".encode())
+
+    def send(self, event):
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow: drop what it has not read and tell its stream to close
+                self.dropped += 1
+                self.clients.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def keepalive(self, interval):
+        # One timer for every connection, so idle clients cost no timer each;
+        # the comment line keeps proxies from closing quiet connections
+        while True:
+            await asyncio.sleep(interval)
+            self.send(b": keepalive\n\n")
+
+    def stats(self):
+        return {"clients": len(self.clients), "published": self.published, "dropped": self.dropped}
+
+broadcaster = Broadcaster(EVENTS_BUFFER)
+
+# _id of the newest entry this worker knows about; it versions the page for ETags
+newest = {"id": None}
+# Approximate number of stored messages; it decides whether the grid is windowed.
+# This worker's writes add to it and refresh_count() picks up everyone else's
+message_count = {"total": 0}
+
+async def refresh_count(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            message_count["total"] = await storage.count()
+        except Exception as e:
+            print(f"Error counting messages: {e}")
+
+async def watch_newest(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            newest_id = await storage.newest_id()
+        except Exception as e:
+            print(f"Error polling for new messages: {e}")
+            continue
+        if newest_id != newest["id"]:
+            # Another worker wrote something
+            previous_id, newest["id"] = newest["id"], newest_id
+            message_cache.invalidate()
+            if broadcaster.clients:
+                await publish_since(previous_id)
+
+async def publish_since(previous_id):
+    # Up to EVENTS_POLL_BATCH entries newer than previous_id, oldest first
+    try:
+        entries = await storage.fetch(EVENTS_POLL_BATCH, preview_chars=PREVIEW_CHARS)
+    except Exception as e:
+        print(f"Error fetching new messages: {e}")
+        return
+    fresh = []
+    for entry in entries:
+        if entry["_id"] == previous_id:
+            break
+        fresh.append(entry)
+    for entry in reversed(fresh):
+        broadcaster.publish(entry)
+
+async def watch_changes():
+    # Push other workers' inserts the moment they happen; polling covers any gap
+    try:
+        async for entry in storage.watch_inserts():
+            broadcaster.publish(make_preview(entry))
+    except Exception as e:
+        print(f"Change stream unavailable, relying on polling: {e}")
+
+class WriteQueue:
+    """Write-behind buffer that turns many submissions into one insert_many.
+
+    A batch is flushed once `batch_size` entries are waiting or `flush_ms` has
+    passed since its first entry. `put()` waits while `max_size` entries are
+    queued, so a stalled database slows submitters down instead of growing
+    memory without bound. `flush` returns the entries it could not write; they
+    are retried up to `retries` times with backoff, then passed to `discard`.
+    """
+    def __init__(self, flush, discard, batch_size, flush_ms, max_size, retries=0, retry_ms=100):
+        self.flush = flush
+        self.discard = discard
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.retries = retries
+        self.retry_ms = retry_ms
+        self.flushes = 0
+        self.flushed = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._queue = asyncio.Queue(max_size)
+        self._task = None
+
+    async def put(self, entry):
+        await self._queue.put(entry)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_ms / 1000
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        unwritten = batch
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.retry_ms / 1000 * 2 ** (attempt - 1))
+                try:
+                    unwritten = await self.flush(unwritten)
+                except Exception as e:
+                    print(f"Database error flushing {len(unwritten)} messages: {e}")
+                    continue
+                if not unwritten:
+                    break
+                print(f"Database error: {len(unwritten)} of {len(batch)} messages not written")
+            self.flushed += len(batch) - len(unwritten)
+            if unwritten:
+                self.failed += len(unwritten)
+                self.discard(unwritten)
+        finally:
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def close(self):
+        # Flush whatever is still queued before the process exits
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+async def flush_messages(entries):
+    failed = await storage.insert_many(entries)
+    failed_ids = {entry["_id"] for entry in failed}
+    written = [entry for entry in entries if entry["_id"] not in failed_ids]
+    if written:
+        for entry in written:
+            message_cache.add(make_preview(entry))
+        newest["id"] = written[-1]["_id"]
+        message_count["total"] += len(written)
+        for entry in written:
+            broadcaster.publish(make_preview(entry))
+    return failed
+
+def discard_messages(entries):
+    # Never written, so the same message can be posted again
+    for entry in entries:
+        duplicates.forget(DuplicateFilter.key(entry["name"], entry["message"]))
+
+write_queue = WriteQueue(
+    flush_messages, discard_messages, WRITE_BATCH_SIZE, WRITE_FLUSH_MS, WRITE_QUEUE_MAX, WRITE_RETRIES, WRITE_RETRY_MS
+) if WRITE_BEHIND else None
+
+async def get_messages(limit=PAGE_SIZE, before_cursor=None):
+    """Return one page of messages, newest first, plus the cursor for the next page.
+
+    Pages are keyset-based on (created_at, _id) and served from the storage
+    backend's created_at index, so the cost of a page does not depend on how deep
+    into the guestbook it is. The next cursor is None on the last page.
+    Pages inside the newest MESSAGE_CACHE_SIZE entries come from message_cache.
+    """
+    if before_cursor:
+        decode_cursor(before_cursor)
+    page = message_cache.get_page(limit, before_cursor)
+    if page is not None:
+        return page
+    if not db_status["ready"]:
+        return [], None
+    try:
+        if before_cursor is None:
+            messages, more = await query_messages(message_cache.size)
+            message_cache.load(messages, complete=more is None)
+            page = messages[:limit]
+            has_more = len(messages) > limit or more is not None
+            return page, encode_cursor(page[-1]) if page and has_more else None
+        return await query_messages(limit, before_cursor)
     except Exception as e:
         print(f"Error fetching messages: {e}")
-        return []
+        return [], None
+
+def search_terms(q):
+    return re.findall(r"\w+", (q or "").lower())[:SEARCH_MAX_TERMS]
+
+async def search_messages(terms, cursor=None, limit=PAGE_SIZE):
+    """Return one page of entries containing every term, plus the next cursor.
+
+    SQLite orders results newest insert first and MongoDB best match first;
+    the cursor format is the backend's own.
+    """
+    before = storage.parse_search_cursor(cursor) if cursor else None
+    if not terms or not db_status["ready"]:
+        return [], None
+    try:
+        messages = await storage.search(terms, limit + 1, before, preview_chars=PREVIEW_CHARS)
+    except Exception as e:
+        print(f"Error searching messages: {e}")
+        return [], None
+    page = messages[:limit]
+    return page, storage.search_cursor(before, page) if len(messages) > limit else None
+
+def highlight_pattern(terms):
+    return re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
 
-def render_message(entry):
+def highlighted(text, pattern):
+    """Split `text` into plain strings and Mark elements around matches of `pattern`."""
+    if pattern is None:
+        return [text]
+    parts, last = [], 0
+    for match in pattern.finditer(text):
+        parts += [text[last:match.start()], Mark(match.group())]
+        last = match.end()
+    return parts + [text[last:]]
+
+def render_expand_button(entry):
+    # /message/{id} only serves approved entries
+    if not entry.get('truncated') or '_id' not in entry or entry.get('status') == PENDING:
+        return ""
+    return Button(
+        I(_class="fas fa-angle-down"),
+        " Read more",
+        hx_get=f"/message/{entry['_id']}",
+        hx_target="closest .message-body",
+        hx_swap="innerHTML",
+        _class="expand-btn"
+    )
+
+def render_message(entry, highlight=None):
     return (
         Article(
             Header(
                 Div(
                     I(_class="fas fa-user-circle user-icon"),
-                    Span(entry.get('name', 'Anonymous'), _class="username"),
+                    Span(*highlighted(entry.get('name', 'Anonymous'), highlight), _class="username"),
                     _class="user-info"
                 ),
                 _class="message-header"
             ),
             Div(
-                P(
-                    entry.get('message', 'No message'),
-                    _class="message-content",
-                    **{"_hx-on:load": """
-                        if(this.scrollHeight > this.clientHeight) {
-                            this.classList.add('scrollable');
-                        }
-                    """}
-                ),
+                # Overflow is checked once per page by cards.js, not per card
+                P(*highlighted(entry.get('message', 'No message'), highlight), _class="message-content"),
+                render_expand_button(entry),
                 _class="message-body"
             ),
             Footer(
                 I(_class="far fa-clock"),
-                Small(entry.get('timestamp', 'Unknown time')),
+                Small(format_timestamp(entry)),
                 _class="message-footer"
             ),
+            id=f"msg-{entry['_id']}" if entry.get('_id') is not None else None,
             _class="message-card"
         )
     )
 
-def render_message_list():
-    messages = get_messages()
-    message_elements = [render_message(entry) for entry in messages]
-    
-    if not message_elements:
-        message_elements = [
-            Div(
-                I(_class="far fa-comment-dots empty-icon"),
-                H3("No messages yet"),
-                P("Be the first to leave a message!"),
-                _class="empty-state"
-            )
-        ]
-    
+def render_load_more(cursor, path="/messages", **params):
+    # Sentinel that htmx swaps for the next page once it scrolls into view
+    return Div(
+        I(_class="fas fa-spinner fa-spin"),
+        hx_get=f"{path}?{urlencode({**params, 'cursor': cursor})}",
+        hx_trigger="revealed",
+        hx_swap="outerHTML",
+        _class="load-more"
+    )
+
+class FragmentCache:
+    """LRU of rendered message cards keyed by _id, bounded by total encoded size.
+
+    Messages do not change once approved, so a card never needs invalidating;
+    it only falls out when the byte budget is exceeded. moderate() replaces the
+    card the poster was shown while the entry was pending.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            cached = self._fragments.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return cached[0]
+
+    def put(self, key, html):
+        size = len(html.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._fragments.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._fragments[key] = (html, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._fragments.popitem(last=False)
+                self.bytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._fragments)
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self.bytes}
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+def render_message_html(entry):
+    key = str(entry.get('_id', ''))
+    html = fragment_cache.get(key) if key else None
+    if html is not None:
+        return NotStr(html)
+    html = to_xml(render_message(entry))
+    if key:
+        fragment_cache.put(key, html)
+    return NotStr(html)
+
+def render_message_page(messages, next_cursor):
+    elements = [render_message_html(entry) for entry in messages]
+    if next_cursor:
+        elements.append(render_load_more(next_cursor))
+    return elements
+
+def render_empty_state():
     return Div(
-        Div(*message_elements, _class="message-grid"),
+        I(_class="far fa-comment-dots empty-icon"),
+        H3("No messages yet"),
+        P("Be the first to leave a message!"),
+        _class="empty-state"
+    )
+
+def render_message_grid(*elements, **attrs):
+    return Div(
+        Div(*elements, _class="message-grid"),
         id="message-list",
+        **attrs
     )
 
+def use_virtual_grid():
+    return VIRTUAL_GRID_THRESHOLD > 0 and message_count["total"] > VIRTUAL_GRID_THRESHOLD
+
+def render_virtual_grid(messages, next_cursor):
+    # virtual.js fetches further chunks from /messages/chunk and swaps chunks far
+    # off screen for empty placeholders of the same height
+    return Div(
+        Div(*[render_message_html(entry) for entry in messages], _class="message-grid"),
+        id="message-list",
+        data_virtual="",
+        data_next_cursor=next_cursor or "",
+    )
+
+async def render_message_list():
+    messages, next_cursor = await get_messages()
+    page_messages.observe(len(messages))
+    start = time.perf_counter()
+    if messages and use_virtual_grid():
+        message_list = render_virtual_grid(messages, next_cursor)
+    else:
+        message_elements = render_message_page(messages, next_cursor)
+
+        if not message_elements:
+            message_elements = [render_empty_state()]
+
+        message_list = render_message_grid(*message_elements)
+    render_seconds.labels("build").observe(time.perf_counter() - start)
+    return message_list
+
+def serialize(message_list):
+    start = time.perf_counter()
+    body = to_xml(message_list).encode()
+    render_seconds.labels("serialize").observe(time.perf_counter() - start)
+    rendered_bytes.observe(len(body))
+    return body
+
+def render_search_page(q, messages, next_cursor):
+    # Highlighted cards differ per query, so they bypass fragment_cache
+    pattern = highlight_pattern(search_terms(q))
+    elements = [render_message(entry, pattern) for entry in messages]
+    if next_cursor:
+        elements.append(render_load_more(next_cursor, "/search", q=q))
+    return elements
+
+def render_search_results(q, messages, next_cursor):
+    elements = render_search_page(q, messages, next_cursor)
+    if not elements:
+        elements = [Div(
+            I(_class="fas fa-search empty-icon"),
+            H3("No matching messages"),
+            P("Try different words."),
+            _class="empty-state"
+        )]
+    # Marked so that live.js does not add new cards to search results
+    return render_message_grid(*elements, data_search="")
+
+async def stream_messages(limit):
+    """Yield up to `limit` newest entries, then the next cursor (or None).
+
+    Entries come from message_cache when it covers the page, otherwise straight
+    off a storage cursor in STREAM_BATCH_SIZE batches. Only preview-sized
+    entries for this one page are held, and they seed message_cache afterwards.
+    """
+    page = message_cache.get_page(limit)
+    if page is not None:
+        for entry in page[0]:
+            yield entry
+        yield page[1]
+        return
+    if not db_status["ready"]:
+        yield None
+        return
+    streamed = []
+    async for entry in storage.iterate(limit + 1, preview_chars=PREVIEW_CHARS, batch_size=STREAM_BATCH_SIZE):
+        if len(streamed) == limit:
+            message_cache.load(streamed, complete=False)
+            yield encode_cursor(streamed[-1])
+            return
+        streamed.append(entry)
+        yield entry
+    message_cache.load(streamed, complete=True)
+    yield None
+
 def render_theme_toggle():
-    # Theme toggle script
-    theme_script = Script("""
-    document.addEventListener('DOMContentLoaded', function() {
-        // Check for saved theme preference
-        const savedTheme = localStorage.getItem('theme') || 'light';
-        document.documentElement.setAttribute('data-theme', savedTheme);
-        
-        // Update active button state
-        updateActiveThemeButton(savedTheme);
-        
-        // Set up theme buttons
-        document.querySelectorAll('.theme-btn').forEach(button => {
-            button.addEventListener('click', function() {
-                const theme = this.getAttribute('data-theme');
-                document.documentElement.setAttribute('data-theme', theme);
-                localStorage.setItem('theme', theme);
-                updateActiveThemeButton(theme);
-            });
-        });
-        
-        function updateActiveThemeButton(activeTheme) {
-            document.querySelectorAll('.theme-btn').forEach(btn => {
-                if (btn.getAttribute('data-theme') === activeTheme) {
-                    btn.classList.add('active');
-                } else {
-                    btn.classList.remove('active');
-                }
-            });
-        }
-    });
-    """)
-    
     return Div(
         H3("Theme", _class="theme-title"),
         Div(
@@ -163,537 +963,10 @@ def render_theme_toggle():
             ),
             _class="theme-toggle-group"
         ),
-        theme_script,
         _class="theme-toggle-container"
     )
 
-def render_content():
-    css_style = Style(
-        """
-        /* Theme Variables */
-        :root {
-            /* Light Theme (default) */
-            --bg-gradient: linear-gradient(120deg, #f8f9fa 0%, #e9ecef 100%);
-            --card-bg: #ffffff;
-            --card-shadow: 0 10px 20px rgba(0, 0, 0, 0.08);
-            --card-hover-shadow: 0 15px 30px rgba(0, 0, 0, 0.12);
-            --primary: #4361ee;
-            --secondary: #3f37c9;
-            --accent: #4895ef;
-            --text-primary: #212529;
-            --text-secondary: #6c757d;
-            --border: #dee2e6;
-            --form-bg: rgba(255, 255, 255, 0.9);
-            --header-bg: linear-gradient(135deg, #4361ee, #4895ef);
-            --input-bg: #f8f9fa;
-            --theme-btn-bg: #f8f9fa;
-            --theme-btn-text: #212529;
-            --theme-btn-active-bg: #4361ee;
-            --theme-btn-active-text: #ffffff;
-            --footer-bg: rgba(255, 255, 255, 0.8);
-            --scrollbar-track: #f1f1f1;
-            --scrollbar-thumb: #4361ee;
-
-            --text-username: #212529;
-        }
-        
-        /* Dark Theme */
-        [data-theme="dark"] {
-            --bg-gradient: linear-gradient(120deg, #121212 0%, #1e1e1e 100%);
-            --card-bg: #2d2d2d;
-            --card-shadow: 0 10px 20px rgba(0, 0, 0, 0.25);
-            --card-hover-shadow: 0 15px 30px rgba(0, 0, 0, 0.3);
-            --primary: #4cc9f0;
-            --secondary: #4895ef;
-            --accent: #3a86ff;
-            --text-primary: #f8f9fa;
-            --text-secondary: #adb5bd;
-            --border: #495057;
-            --form-bg: rgba(45, 45, 45, 0.9);
-            --header-bg: linear-gradient(135deg, #4cc9f0, #3a86ff);
-            --input-bg: #343a40;
-            --theme-btn-bg: #343a40;
-            --theme-btn-text: #f8f9fa;
-            --theme-btn-active-bg: #4cc9f0;
-            --theme-btn-active-text: #212529;
-            --footer-bg: rgba(45, 45, 45, 0.8);
-            --scrollbar-track: #343a40;
-            --scrollbar-thumb: #4cc9f0;
-
-            --text-username: #f8f9fa;
-        }
-
-        /* Cosmic Theme */
-        [data-theme="cosmic"] {
-            --bg-gradient: linear-gradient(120deg, #10002b 0%, #240046 100%);
-            --card-bg: #e3d1f5;
-            --card-shadow: 0 10px 20px rgba(0, 0, 0, 0.3);
-            --card-hover-shadow: 0 15px 30px rgba(0, 0, 0, 0.4);
-            --primary: #bf7af0;       /* Slightly brighter primary */
-            --secondary: #d8b4ff;     /* Brighter secondary */
-            --accent: #ffffff;        /* Pure white accent for better visibility */
-            --text-primary: #bf7af0;  /* Changed from white to light purple for theme consistency */
-            --text-secondary: #4e008d; /* Much lighter purple, almost white */
-            --border: #5a189a;
-            --form-bg: rgba(60, 9, 108, 0.9);
-            --header-bg: linear-gradient(135deg, #9d4edd, #e0aaff);
-            --input-bg: #240046;
-            --theme-btn-bg: #240046;
-            --theme-btn-text: #ffffff; /* Pure white for button text */
-            --theme-btn-active-bg: #c77dff;
-            --theme-btn-active-text: #10002b; /* Dark background color for contrast */
-            --footer-bg: rgba(60, 9, 108, 0.8);
-            --scrollbar-track: #240046;
-            --scrollbar-thumb: #c77dff;
-
-            --text-username: #ffffff;
-        }
-
-        
-        
-        /* Base Styles */
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-            transition: background-color 0.3s ease, color 0.3s ease, border-color 0.3s ease, box-shadow 0.3s ease;
-        }
-        
-        body {
-            font-family: 'Inter', sans-serif;
-            line-height: 1.6;
-            color: var(--text-primary);
-            background: var(--bg-gradient);
-            background-attachment: fixed;
-            min-height: 100vh;
-            padding: 20px;
-        }
-        
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            position: relative;
-        }
-        
-        /* Header Styles */
-        .guestbook-header {
-            text-align: center;
-            padding: 35px 25px;
-            margin-bottom: 40px;
-            background: var(--header-bg);
-            border-radius: 16px;
-            color: white;
-            box-shadow: 0 10px 25px rgba(0, 0, 0, 0.1), 0 3px 6px rgba(0, 0, 0, 0.05);
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .guestbook-header::before {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background: radial-gradient(circle at 40% 40%, rgba(255, 255, 255, 0.15) 0%, transparent 40%);
-        }
-        
-        .guestbook-header h1 {
-            margin: 0;
-            font-size: 2.5rem;
-            font-weight: 700;
-            text-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-            position: relative;
-        }
-        
-        .guestbook-header p {
-            margin-top: 12px;
-            font-size: 1.1rem;
-            opacity: 0.9;
-            position: relative;
-        }
-        
-        .guestbook-image {
-            width: 90px;
-            height: 90px;
-            border-radius: 50%;
-            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.2);
-            transition: all 0.3s ease;
-            border: 3px solid white;
-            display: block;
-            margin: 20px auto 10px;
-            object-fit: cover;
-            position: relative;
-        }
-        
-        .guestbook-image:hover {
-            transform: scale(1.1) rotate(5deg);
-        }
-        
-        /* Form Styles */
-        .form-container {
-            background: var(--form-bg);
-            padding: 35px;
-            border-radius: 16px;
-            box-shadow: var(--card-shadow);
-            margin: 20px auto 40px;
-            max-width: 600px;
-            backdrop-filter: blur(10px);
-            border: 1px solid var(--border);
-        }
-        
-        .form-title {
-            margin-bottom: 20px;
-            color: var(--primary);
-            font-weight: 600;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        fieldset {
-            border: none;
-            padding: 0;
-            margin: 0;
-        }
-        
-        .input-wrapper {
-            margin-bottom: 20px;
-            position: relative;
-        }
-        
-        .input-icon {
-            position: absolute;
-            left: 15px;
-            top: 50%;
-            transform: translateY(-50%);
-            color: var(--secondary);
-        }
-        
-        input[type="text"] {
-            width: 100%;
-            padding: 14px 15px 14px 45px;
-            border: 2px solid var(--border);
-            border-radius: 12px;
-            font-size: 16px;
-            transition: all 0.3s ease;
-            background: var(--input-bg);
-            color: var(--text-primary);
-        }
-        
-        input[type="text"]:focus {
-            border-color: var(--primary);
-            outline: none;
-            box-shadow: 0 0 0 3px rgba(67, 97, 238, 0.25);
-        }
-        
-        .message-input {
-            width: 100%;
-            padding: 14px 15px 14px 45px;
-            border: 2px solid var(--border);
-            border-radius: 12px;
-            font-size: 16px;
-            font-family: 'Inter', sans-serif;
-            min-height: 100px;
-            resize: vertical;
-            transition: all 0.3s ease;
-            background: var(--input-bg);
-            color: var(--text-username);
-        }
-        
-        .message-input:focus {
-            border-color: var(--primary);
-            outline: none;
-            box-shadow: 0 0 0 3px rgba(67, 97, 238, 0.25);
-        }
-        
-        .message-icon {
-            top: 20px;
-            transform: none;
-        }
-        
-        button[type="submit"] {
-            width: 100%;
-            padding: 14px 25px;
-            background: linear-gradient(135deg, var(--primary), var(--secondary));
-            color: white;
-            border: none;
-            border-radius: 12px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            box-shadow: 0 4px 15px rgba(67, 97, 238, 0.3);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            gap: 10px;
-        }
-        
-        button[type="submit"]:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(67, 97, 238, 0.4);
-        }
-        
-        button[type="submit"]:active {
-            transform: translateY(1px);
-        }
-        
-        /* Theme Toggle Styles */
-        .theme-toggle-container {
-            background: var(--form-bg);
-            border-radius: 16px;
-            padding: 20px;
-            margin-bottom: 30px;
-            box-shadow: var(--card-shadow);
-            backdrop-filter: blur(10px);
-            border: 1px solid var(--border);
-        }
-        
-        .theme-title {
-            font-size: 18px;
-            margin-bottom: 15px;
-            color: var(--primary);
-            font-weight: 600;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .theme-toggle-group {
-            display: flex;
-            gap: 15px;
-            flex-wrap: wrap;
-        }
-        
-        .theme-btn {
-            flex: 1;
-            min-width: 100px;
-            padding: 12px 15px;
-            border-radius: 12px;
-            border: 1px solid var(--border);
-            background: var(--theme-btn-bg);
-            color: var(--theme-btn-text);
-            cursor: pointer;
-            transition: all 0.2s ease;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            gap: 10px;
-            font-weight: 500;
-        }
-        
-        .theme-btn.active {
-            background: var(--theme-btn-active-bg);
-            color: var(--theme-btn-active-text);
-            border-color: var(--theme-btn-active-bg);
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.15);
-        }
-        
-        .theme-btn:hover:not(.active) {
-            border-color: var(--primary);
-            transform: translateY(-2px);
-        }
-        
-        /* Message Grid Layout */
-        .message-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 25px;
-            margin-top: 30px;
-        }
-        
-        .message-card {
-            border: 1px solid var(--border);
-            border-radius: 16px;
-            background: var(--card-bg);
-            box-shadow: var(--card-shadow);
-            transition: all 0.3s ease;
-            height: 300px;
-            display: flex;
-            flex-direction: column;
-            overflow: hidden;
-            position: relative;
-        }
-        
-        .message-card:hover {
-            transform: translateY(-5px);
-            box-shadow: var(--card-hover-shadow);
-        }
-        
-        .message-header {
-            padding: 20px 20px 15px;
-            border-bottom: 1px solid var(--border);
-        }
-        
-        .user-info {
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .user-icon {
-            color: var(--primary);
-            font-size: 20px;
-        }
-        
-        .username {
-            font-weight: 600;
-            color: var(--text-primary);
-        }
-        
-        .message-body {
-            padding: 15px 20px;
-            flex-grow: 1;
-            overflow: hidden;
-            position: relative;
-        }
-        
-        .message-content {
-            margin: 0;
-            color: var(--text-secondary);
-            line-height: 1.7;
-            height: 100%;
-            overflow-y: auto;
-            padding-right: 10px;
-        }
-        
-        .message-content::-webkit-scrollbar {
-            width: 6px;
-        }
-        
-        .message-content::-webkit-scrollbar-track {
-            background: var(--scrollbar-track);
-            border-radius: 3px;
-        }
-        
-        .message-content::-webkit-scrollbar-thumb {
-            background-color: var(--scrollbar-thumb);
-            border-radius: 3px;
-        }
-        
-        .message-footer {
-            padding: 15px 20px;
-            border-top: 1px solid var(--border);
-            display: flex;
-            align-items: center;
-            gap: 10px;
-            color: var(--text-secondary);
-            font-size: 14px;
-        }
-        
-        /* Empty State */
-        .empty-state {
-            grid-column: 1 / -1;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            background: var(--card-bg);
-            border-radius: 16px;
-            padding: 40px;
-            text-align: center;
-            box-shadow: var(--card-shadow);
-            border: 1px solid var(--border);
-            color: var(--text-secondary);
-        }
-        
-        .empty-icon {
-            font-size: 48px;
-            margin-bottom: 15px;
-            color: var(--primary);
-        }
-        
-        /* Footer */
-        .footer {
-            text-align: center;
-            margin-top: 30px;
-            padding: 20px;
-            color: var(--text-secondary);
-            background: var(--footer-bg);
-            border-radius: 16px;
-            backdrop-filter: blur(10px);
-            border: 1px solid var(--border);
-        }
-        
-        .footer a {
-            color: var(--primary);
-            text-decoration: none;
-            font-weight: 500;
-        }
-        
-        .footer a:hover {
-            text-decoration: underline;
-        }
-        
-        .author-links {
-            display: flex;
-            justify-content: center;
-            gap: 20px;
-            margin-top: 15px;
-        }
-        
-        .author-link {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        .heart {
-            color: #ff6b6b;
-            display: inline-block;
-            animation: heartbeat 1.5s infinite;
-        }
-        
-        @keyframes heartbeat {
-            0%, 100% { transform: scale(1); }
-            50% { transform: scale(1.1); }
-        }
-        
-        /* Animations */
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        .message-card {
-            animation: fadeIn 0.3s ease-out;
-        }
-        
-        /* Responsive Styles */
-        @media (max-width: 768px) {
-            .container {
-                padding: 10px;
-            }
-            
-            .guestbook-header {
-                padding: 25px 15px;
-            }
-            
-            .guestbook-header h1 {
-                font-size: 2rem;
-            }
-            
-            .form-container {
-                padding: 25px;
-            }
-            
-            .theme-toggle-group {
-                flex-direction: column;
-            }
-            
-            .message-grid {
-                grid-template-columns: 1fr;
-            }
-            
-            .message-card {
-                height: auto;
-                min-height: 200px;
-            }
-        }
-        """
-    )
-
+def render_content(message_list):
     # Form component
     form = Form(
         H3(I(_class="far fa-comment-dots"), " Leave a Message", _class="form-title"),
@@ -724,14 +997,30 @@ def render_content():
             ),
             role="group",
         ),
+        Div(id="form-status", _class="form-status"),
         method="post",
         hx_post="/submit-message",
-        hx_target="#message-list",
-        hx_swap="outerHTML",
+        hx_target="#message-list .message-grid",
+        hx_swap="afterbegin",
+        # Show the rate limiter's 429 message like any other form error
+        hx_on__before_swap="if (event.detail.xhr.status === 429) { event.detail.shouldSwap = true; event.detail.isError = false; }",
         hx_on__after_request="this.reset()",
         _class="form-container"
     )
 
+    # Search box; results replace the message list
+    search = Form(
+        I(_class="fas fa-search input-icon"),
+        Input(type="search", name="q", placeholder="Search messages", maxlength=200),
+        action="/search",
+        method="get",
+        hx_get="/search",
+        hx_target="#message-list",
+        hx_swap="outerHTML",
+        hx_trigger="input changed delay:300ms, search, submit",
+        _class="search-form input-wrapper"
+    )
+
     # Header component
     header = Div(
         H1("Suji's Guestbook"),
@@ -759,45 +1048,319 @@ def render_content():
     )
 
     return Div(
-        css_style,
         Div(
             header,
             image_with_link,
             render_theme_toggle(),
             form,
-            render_message_list(),
+            search,
+            message_list,
             footer,
             _class="container"
         )
     )
 
+MESSAGE_LIST_SLOT = "<!-- message-list -->"
+
+def render_page_shell():
+    """Render the full page once, split around the message list slot."""
+    title, main = Titled("   ", render_content(NotStr(MESSAGE_LIST_SLOT)))
+    page = Html(
+        Head(title, *flat_xt(app.router.hdrs)),
+        Body(main, *flat_xt(app.router.ftrs), **app.router.bodykw),
+        **app.router.htmlkw
+    )
+    head, tail = to_xml(page).split(MESSAGE_LIST_SLOT)
+    return f"<!doctype html>\n{head}".encode(), tail.encode()
+
+PAGE_HEAD, PAGE_TAIL = render_page_shell()
+LIST_HEAD, LIST_TAIL = (part.encode() for part in to_xml(render_message_grid(NotStr(MESSAGE_LIST_SLOT))).split(MESSAGE_LIST_SLOT))
+EMPTY_STATE = to_xml(render_empty_state()).encode()
+
+async def stream_page():
+    yield PAGE_HEAD + LIST_HEAD
+    empty = True
+    try:
+        async for item in stream_messages(STREAM_PAGE_SIZE):
+            if isinstance(item, dict):
+                empty = False
+                yield render_message_html(item).encode()
+            elif item:
+                yield to_xml(render_load_more(item)).encode()
+    except Exception as e:
+        # Headers are already sent, so close the page cleanly instead of failing
+        print(f"Error streaming messages: {e}")
+    if empty:
+        yield EMPTY_STATE
+    yield LIST_TAIL + PAGE_TAIL
+
+def serve_asset(path, cache_control=ASSET_CACHE_CONTROL):
+    # .br/.gz siblings come from `python compression.py`, run at build time
+    variants = find_variants(path)
+    media_type = mimetypes.guess_type(path)[0]
+    async def endpoint(request):
+        file_path, encoding = negotiate_file(path, request.headers.get("accept-encoding", ""), variants)
+        headers = {"Cache-Control": cache_control}
+        if variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return FileResponse(file_path, media_type=media_type, headers=headers)
+    return endpoint
+
+# Registered ahead of fast_app's catch-all static route so the hashed names resolve
+for name, url in ASSET_URLS.items():
+    app.routes.insert(0, Route(url, serve_asset(os.path.join(ASSETS_DIR, name))))
+app.routes.insert(0, Route("/assets/me.ico", serve_asset(os.path.join(ASSETS_DIR, "me.ico"), ICON_CACHE_CONTROL)))
+
+# Changes whenever the page shell does, e.g. after a deploy with new assets
+SHELL_DIGEST = hashlib.sha256(
+    PAGE_HEAD + LIST_HEAD + LIST_TAIL + PAGE_TAIL + str(VIRTUAL_GRID_THRESHOLD).encode()
+).hexdigest()[:12]
+
+def page_etag():
+    if not db_status["ready"]:
+        return None
+    return f'W/"{SHELL_DIGEST}-{newest["id"] or "empty"}"'
+
+def cache_headers(etag):
+    return {
+        "ETag": etag,
+        # Browsers revalidate every time (a cheap 304); shared caches may reuse briefly
+        "Cache-Control": f"public, max-age=0, s-maxage={PAGE_CACHE_SECONDS}",
+    }
+
+def not_modified(request, etag):
+    # Checked before any database access or rendering
+    if etag is None:
+        return False
+    return etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(","))
+
 @rt('/')
+async def get(request):
+    etag = page_etag()
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    headers = cache_headers(etag) if etag else None
+    if STREAM_HTML and not use_virtual_grid():
+        return StreamingResponse(stream_page(), media_type="text/html; charset=utf-8", headers=headers)
+    body = serialize(await render_message_list())
+    return Response(PAGE_HEAD + body + PAGE_TAIL, media_type="text/html; charset=utf-8", headers=headers)
+
+@rt("/messages")
+async def get(request, cursor: str = None):
+    etag = page_etag()
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    try:
+        messages, next_cursor = await get_messages(before_cursor=cursor)
+    except ValueError:
+        return Response("Invalid cursor", status_code=400)
+    page_messages.observe(len(messages))
+    headers = [HttpHeader(k, v) for k, v in cache_headers(etag).items()] if etag else []
+    return (*render_message_page(messages, next_cursor), *headers)
+
+@rt("/messages/chunk")
+async def get(request, cursor: str):
+    # Cards only, for virtual.js; the cursor for the chunk after this one is in a header
+    etag = page_etag()
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    try:
+        messages, next_cursor = await get_messages(VIRTUAL_CHUNK_SIZE, cursor)
+    except ValueError:
+        return Response("Invalid cursor", status_code=400)
+    page_messages.observe(len(messages))
+    headers = {**(cache_headers(etag) if etag else {}), "X-Next-Cursor": next_cursor or ""}
+    body = "".join(str(render_message_html(entry)) for entry in messages)
+    return Response(body, media_type="text/html; charset=utf-8", headers=headers)
+
+@rt("/search")
+async def get(request, q: str = "", cursor: str = None):
+    etag = page_etag()
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    headers = {**(cache_headers(etag) if etag else {}), "Vary": "HX-Request"}
+    terms = search_terms(q)
+    try:
+        messages, next_cursor = await search_messages(terms, cursor)
+    except ValueError:
+        return Response("Invalid cursor", status_code=400)
+    if cursor:
+        # The next page for a load-more sentinel
+        return (*render_search_page(q, messages, next_cursor), *[HttpHeader(k, v) for k, v in headers.items()])
+    # An empty query goes back to the normal list
+    results = render_search_results(q, messages, next_cursor) if terms else await render_message_list()
+    if request.headers.get("hx-request"):
+        return (results, *[HttpHeader(k, v) for k, v in headers.items()])
+    body = to_xml(results).encode()
+    return Response(PAGE_HEAD + body + PAGE_TAIL, media_type="text/html; charset=utf-8", headers=headers)
+
+async def event_stream():
+    queue = broadcaster.subscribe()
+    try:
+        yield b"retry: 5000\n\n"
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            yield event
+    finally:
+        broadcaster.unsubscribe(queue)
+
+@rt("/events")
 def get():
-    return Titled("   ", render_content())
+    if not LIVE_EVENTS:
+        return Response("Live events are disabled", status_code=404)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def render_form_error(text):
+    # Errors go to the form instead of being prepended into the grid
+    return (
+        P(text),
+        HttpHeader("HX-Retarget", "#form-status"),
+        HttpHeader("HX-Reswap", "innerHTML"),
+    )
+
+@rt("/message/{entry_id}")
+async def get(entry_id: str):
+    try:
+        entry = await storage.get(storage.parse_id(entry_id))
+    except ValueError:
+        entry = None
+    except Exception as e:
+        print(f"Error fetching message: {e}")
+        return Response("Could not load message", status_code=503)
+    if entry is None:
+        return Response("Message not found", status_code=404)
+    return P(entry['message'], _class="message-content")
 
 @rt("/submit-message", methods=["post"])
-def post(name: str, message: str):
+async def post(name: str, message: str):
     try:
-        add_message(name, message)
-        return render_message_list()
+        entry = await add_message(name, message)
     except ValueError as ve:
-        return Div(
-            P(f"Error: {ve}"),
-            id="message-list"
-        )
+        return render_form_error(f"Error: {ve}")
     except Exception as e:
-        return Div(
-            P(f"Error: Could not submit message. Please try again. Details: {e}"),
-            id="message-list"
-        )
+        return render_form_error(f"Error: Could not submit message. Please try again. Details: {e}")
+    # Only the new card is sent; the empty state hides itself once a card precedes it
+    status = P("Thanks! Long messages appear for everyone once they are reviewed.") if entry.get("status") == PENDING else ""
+    return (
+        render_message_html(entry),
+        Div(status, id="form-status", _class="form-status", hx_swap_oob="true"),
+    )
+
+def rate_limit_stats():
+    # The limiter is created by Starlette when it builds the middleware stack
+    layer = app.middleware_stack
+    while layer is not None:
+        if isinstance(layer, RateLimitMiddleware):
+            return layer.stats()
+        layer = getattr(layer, "app", None)
+    return {}
+
+registry.collect("db", lambda: {"ready": db_status["ready"]})
+registry.collect("messages", lambda: {"stored": message_count["total"]})
+registry.collect("message_cache", lambda: message_cache.stats())
+registry.collect("fragment_cache", lambda: fragment_cache.stats())
+registry.collect("events", lambda: broadcaster.stats())
+registry.collect("dedupe", lambda: duplicates.stats())
+if moderator is not None:
+    registry.collect("moderation", moderator.stats)
+registry.collect("rate_limit", rate_limit_stats)
+registry.collect("mongo_pool", lambda: storage.pool_stats())
+if ARCHIVE_AFTER_DAYS > 0:
+    registry.collect("archive", lambda: archive_stats)
+if write_queue is not None:
+    registry.collect("write_queue", write_queue.stats)
+
+if METRICS:
+    # Outermost, so request latency includes compression and rate limiting
+    app.add_middleware(MetricsMiddleware, histogram=request_seconds, router=app.router)
+
+@rt("/metrics")
+def get():
+    if not METRICS:
+        return Response("Metrics are disabled", status_code=404)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@rt("/healthz")
+def get():
+    # Liveness: the process is serving requests, whatever the database is doing
+    return JSONResponse({"live": True, **db_status})
+
+@rt("/healthz/ready")
+def get():
+    # Readiness: only route traffic here once the database is connected
+    return JSONResponse(db_status, status_code=200 if db_status["ready"] else 503)
+
+background_tasks = set()
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+archive_stats = {"archived": 0, "last_run_seconds": 0.0}
+
+async def archive_old_messages(interval):
+    # Every worker runs this; a batch another worker already moved is simply gone
+    while True:
+        start = time.perf_counter()
+        cutoff = utc_now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        moved = 0
+        try:
+            while batch := await storage.archive(cutoff, ARCHIVE_BATCH_SIZE):
+                moved += batch
+                await asyncio.sleep(0)  # let requests in between batches
+        except Exception as e:
+            print(f"Archive error: {e}")
+        # Archived entries read the same, so cached pages stay valid
+        archive_stats["archived"] += moved
+        archive_stats["last_run_seconds"] = time.perf_counter() - start
+        await asyncio.sleep(interval)
+
+async def connect_db():
+    # Check the database connection and create indexes, retrying until it works
+    while True:
+        try:
+            await storage.connect()
+            break
+        except Exception as e:
+            db_status["error"] = f"Database connection error: {e}"
+            print(f"{db_status['error']} (retrying in {DB_RETRY_INTERVAL}s)")
+            await asyncio.sleep(DB_RETRY_INTERVAL)
+    try:
+        newest["id"] = await storage.newest_id()
+        message_count["total"] = await storage.count()
+    except Exception as e:
+        print(f"Error fetching newest message: {e}")
+    db_status.update(ready=True, error=None)
+    if moderator is not None:
+        start_background(review_pending())
+    start_background(watch_newest(MESSAGE_CACHE_POLL))
+    start_background(refresh_count(MESSAGE_COUNT_INTERVAL))
+    if LIVE_EVENTS and EVENTS_CHANGE_STREAM:
+        start_background(watch_changes())
+    if write_queue is not None:
+        write_queue.start()
+    if ARCHIVE_AFTER_DAYS > 0:
+        start_background(archive_old_messages(ARCHIVE_INTERVAL))
+
+async def startup():
+    start_background(connect_db())
+    if LIVE_EVENTS:
+        start_background(broadcaster.keepalive(EVENTS_KEEPALIVE))
 
-# Check MongoDB connection
-try:
-    mongo_client.server_info()
-except Exception as e:
-    raise EnvironmentError(f"Database connection error: {e}")
+async def shutdown():
+    if write_queue is not None:
+        await write_queue.close()
 
-if not os.getenv("MONGO_URI"):
-    raise EnvironmentError("Missing required environment variable: MONGO_URI")
+app.router.on_startup.append(startup)
+app.router.on_shutdown.append(shutdown)
 
 serve()
@@ -0,0 +1,143 @@
+"""Prometheus text-format metrics with cheap hot-path instrumentation.
+
+Histograms preallocate their bucket counts, so `observe()` is a bisect and
+two additions; timings use the monotonic `time.perf_counter()`. Labelled
+series are created on first use and looked up by a dict afterwards.
+Components that already keep counters are exported through `Registry.collect()`.
+"""
+import inspect
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTES_BUCKETS = (1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250)
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+class HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram:
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(labels)
+        self.series = {}
+        if not self.label_names:
+            self.series[()] = HistogramSeries(self.buckets)
+
+    def labels(self, *values):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value):
+        self.series[()].observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series.counts):
+                cumulative += count
+                labels = format_labels(self.label_names, values, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {series.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.histograms = []
+        self.collectors = {}
+
+    def histogram(self, name, help, **kwargs):
+        histogram = Histogram(f"{self.prefix}_{name}", help, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def collect(self, name, stats):
+        """Export the numbers in `stats()`'s dict as `<prefix>_<name>_<key>` gauges at scrape time."""
+        self.collectors[name] = stats
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines += histogram.render()
+        for name, stats in self.collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {e}")
+                continue
+            for key, value in (values or {}).items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {self.prefix}_{name}_{key} gauge")
+                    lines.append(f"{self.prefix}_{name}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """Time every HTTP request, labelled by the path template of the route that served it."""
+    def __init__(self, app, histogram, router):
+        self.app = app
+        self.histogram = histogram
+        self.router = router
+        self.paths = {}
+
+    def route_path(self, endpoint):
+        path = self.paths.get(endpoint)
+        if path is None:
+            self.paths = {route.endpoint: route.path for route in self.router.routes if hasattr(route, "endpoint")}
+            # Remember misses (404s, mounts) too, so they do not rebuild the map again
+            path = self.paths.setdefault(endpoint, "other")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router records the matched endpoint in the scope it was given
+            self.histogram.labels(self.route_path(scope.get("endpoint"))).observe(time.perf_counter() - start)
+
+class TimedStorage:
+    """Proxy for a storage backend that times each of its coroutine methods by name."""
+    def __init__(self, backend, histogram):
+        self.backend = backend
+        self._histogram = histogram
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+        series = self._histogram.labels(name)
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - start)
+        # Cache on the proxy so later lookups skip __getattr__
+        setattr(self, name, timed)
+        return timed
@@ -0,0 +1,147 @@
+"""Moderation checks for submissions: blocked words, link floods and near-duplicates.
+
+`Moderator.review()` is plain synchronous code, so that long messages can be
+checked in a thread pool instead of on the event loop. The blocklist is one
+regex compiled from a trie of its terms: terms that share a prefix share a
+branch, so the engine tries a handful of alternatives at each position however
+long the list is. Near-duplicates are found by comparing bottom-k sketches of
+word shingles against those of recent messages.
+"""
+import heapq
+import re
+import threading
+from collections import Counter, OrderedDict
+from itertools import islice
+
+URL_PATTERN = re.compile(r"https?://|www\.", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"\w+")
+
+def load_blocklist(path):
+    """Terms from a file with one word or phrase per line; # starts a comment."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        return []
+
+def trie_pattern(terms):
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = None  # a term ends here
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = f"(?:{pattern})?"
+        return pattern
+    return build(trie)
+
+class Blocklist:
+    """Case-insensitive whole-word matcher for a list of words and phrases."""
+    def __init__(self, terms):
+        terms = {term.lower() for term in terms if term.strip()}
+        self.size = len(terms)
+        self.pattern = re.compile(rf"\b{trie_pattern(terms)}\b") if terms else None
+
+    def find(self, text):
+        # Lowercasing once is cheaper than matching with re.IGNORECASE
+        match = self.pattern.search(text.lower()) if self.pattern else None
+        return match.group(0) if match else None
+
+def count_links(text, limit):
+    # Stops counting past the limit; only whether it was exceeded matters
+    return sum(1 for _ in islice(URL_PATTERN.finditer(text), limit + 1))
+
+def similarity(a, b, size):
+    # Jaccard estimate from the size smallest hashes of the union of both sketches
+    union = heapq.nsmallest(size, a | b)
+    return sum(1 for h in union if h in a and h in b) / len(union)
+
+class NearDuplicates:
+    """Bottom-k sketches of the word shingles of the last `window` messages.
+
+    A new message is a near-duplicate when its estimated Jaccard similarity to
+    a recent one reaches `threshold`. Candidates come from an inverted index of
+    sketch hashes, so only messages that share some of them are compared.
+    """
+    def __init__(self, threshold, window, shingle_words=5, sketch_size=64):
+        self.threshold = threshold
+        self.window = window
+        self.shingle_words = shingle_words
+        self.sketch_size = sketch_size
+        self.recent = OrderedDict()
+        self.postings = {}
+        self.next_key = 0
+        self._lock = threading.Lock()
+
+    def sketch(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        if len(words) < self.shingle_words:
+            # Too short to shingle; exact resubmissions are DuplicateFilter's job
+            return None
+        shingles = {hash(shingle) for shingle in zip(*(words[i:] for i in range(self.shingle_words)))}
+        return frozenset(heapq.nsmallest(self.sketch_size, shingles))
+
+    def check(self, sketch):
+        """Return the best similarity to a recent message, remembering `sketch` if it is below threshold."""
+        with self._lock:
+            shared = Counter(key for h in sketch for key in self.postings.get(h, ()))
+            # Sketches that agree on a threshold fraction of the union share about that many hashes
+            best = max(
+                (similarity(sketch, self.recent[key], self.sketch_size)
+                 for key, count in shared.items() if count >= self.threshold * len(sketch) / 2),
+                default=0.0,
+            )
+            if best < self.threshold:
+                self._add(sketch)
+            return best
+
+    def _add(self, sketch):
+        key, self.next_key = self.next_key, self.next_key + 1
+        self.recent[key] = sketch
+        for h in sketch:
+            self.postings.setdefault(h, set()).add(key)
+        if len(self.recent) > self.window:
+            old_key, old_sketch = self.recent.popitem(last=False)
+            for h in old_sketch:
+                keys = self.postings[h]
+                keys.discard(old_key)
+                if not keys:
+                    del self.postings[h]
+
+class Moderator:
+    def __init__(self, blocklist, max_links, near_duplicates=None):
+        self.blocklist = blocklist
+        self.max_links = max_links
+        self.near_duplicates = near_duplicates
+        self.reviewed = 0
+        self.rejected = Counter()
+
+    def review(self, name, message):
+        """Return None if the entry may be shown, or why it may not."""
+        self.reviewed += 1
+        reason = None
+        if self.blocklist.find(name) or self.blocklist.find(message):
+            reason = "blocked_word"
+        elif count_links(message, self.max_links) > self.max_links:
+            reason = "too_many_links"
+        elif self.near_duplicates is not None:
+            sketch = self.near_duplicates.sketch(message)
+            if sketch is not None and self.near_duplicates.check(sketch) >= self.near_duplicates.threshold:
+                reason = "near_duplicate"
+        if reason:
+            self.rejected[reason] += 1
+        return reason
+
+    def stats(self):
+        return {
+            "reviewed": self.reviewed,
+            "blocklist_terms": self.blocklist.size,
+            **{f"rejected_{reason}": count for reason, count in self.rejected.items()},
+        }
@@ -0,0 +1,190 @@
+"""Production server: a master process that loads the app once and forks uvicorn workers.
+
+    python prefork.py [--workers N] [--host 0.0.0.0] [--port 5001] [--reuse-port]
+
+main is imported before forking, so the routes, page shell and asset table are
+shared copy-on-write. Workers connect to the database in their own startup
+handlers, since pymongo clients are not fork-safe. They accept from one socket,
+or with --reuse-port each binds its own. A worker that dies is replaced.
+
+TERM or INT stops the workers gracefully. HUP re-executes the master with the
+current code, keeping the socket, and stops the old workers once new ones accept.
+Caches, the duplicate filter and memory rate limits are per worker.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+import traceback
+import uvicorn
+
+# Defaults, overridable on the command line
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+PORT = int(os.getenv("PORT", 5001))
+READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", 30))
+GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+
+HANDLED = {signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD}
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def listen(host, port, reuse_port=False):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+def run_worker(app, sock, args, ready_fd):
+    # The master blocks the signals it handles; uvicorn needs TERM and INT back
+    signal.pthread_sigmask(signal.SIG_SETMASK, set())
+    if sock is None:
+        sock = listen(args.host, args.port, reuse_port=True)
+    server = uvicorn.Server(uvicorn.Config(
+        app, lifespan="on", access_log=args.access_log, timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    ))
+
+    async def serve():
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.01)
+        os.write(ready_fd, b"1")
+        os.close(ready_fd)
+        await serving
+    asyncio.run(serve())
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.workers = set()
+        inherited = os.environ.pop("PREFORK_FD", None)
+        if args.reuse_port:
+            self.sock = None
+        elif inherited:
+            self.sock = socket.socket(fileno=int(inherited))
+        else:
+            self.sock = listen(args.host, args.port)
+        # Children of the master that exec'd into this one, to stop once ours accept
+        self.retiring = {int(pid) for pid in os.environ.pop("PREFORK_OLD_WORKERS", "").split(",") if pid}
+
+    def preload(self):
+        import main
+        self.app = main.app
+        # Starlette builds this on the first request; do it once, before the fork
+        self.app.middleware_stack = self.app.build_middleware_stack()
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self):
+        ready_r, ready_w = os.pipe()
+        sys.stdout.flush()  # or the child would print the master's buffered output again
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            try:
+                run_worker(self.app, self.sock, self.args, ready_w)
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        os.close(ready_w)
+        self.workers.add(pid)
+        return ready_r
+
+    def start_workers(self, count):
+        pending = [self.spawn() for _ in range(count)]
+        deadline = time.monotonic() + READY_TIMEOUT
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(pending, [], [], deadline - time.monotonic())
+            for fd in readable:
+                os.read(fd, 1)
+                os.close(fd)
+                pending.remove(fd)
+        for fd in pending:
+            os.close(fd)
+        if pending:
+            print(f"{len(pending)} workers not ready after {READY_TIMEOUT}s")
+
+    def stop(self, pids, timeout=GRACEFUL_TIMEOUT):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            self.reap(respawn=False)
+            remaining &= self.workers | self.retiring
+            time.sleep(0.05)
+        for pid in remaining:
+            print(f"Worker {pid} did not stop in {timeout}s, killing it")
+            os.kill(pid, signal.SIGKILL)
+        self.reap(respawn=False)
+
+    def reap(self, respawn=True):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if respawn:
+                    print(f"Worker {pid} exited with status {status}, starting another")
+                    time.sleep(0.1)  # do not spin if workers crash on startup
+                    self.start_workers(1)
+
+    def reload(self):
+        # A new master that cannot import the app would leave nothing serving
+        # The app's directory goes on the path, wherever the master was started;
+        # the working directory stays, so relative paths like SQLITE_PATH still hold
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+        check = subprocess.run([sys.executable, "-c", "import main"], env=env, capture_output=True, text=True)
+        if check.returncode:
+            print(f"Reload aborted, the app does not import:\n{check.stderr}")
+            return
+        env["PREFORK_OLD_WORKERS"] = ",".join(map(str, self.workers | self.retiring))
+        if self.sock is not None:
+            self.sock.set_inheritable(True)
+            env["PREFORK_FD"] = str(self.sock.fileno())
+        os.execve(sys.executable, [sys.executable, os.path.join(ROOT, "prefork.py"), *sys.argv[1:]], env)
+
+    def run(self):
+        signal.pthread_sigmask(signal.SIG_BLOCK, HANDLED)
+        self.preload()
+        self.start_workers(self.args.workers)
+        print(f"Master {os.getpid()} serving http://{self.args.host}:{self.args.port} with {len(self.workers)} workers")
+        if self.retiring:
+            self.stop(set(self.retiring))
+        while True:
+            info = signal.sigtimedwait(HANDLED, 1.0)
+            self.reap()
+            if info is None or info.si_signo == signal.SIGCHLD:
+                continue
+            if info.si_signo == signal.SIGHUP:
+                print("Reloading")
+                self.reload()
+            else:
+                print("Stopping")
+                self.stop(self.workers | self.retiring)
+                return
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--reuse-port", action="store_true", help="one SO_REUSEPORT socket per worker")
+    parser.add_argument("--access-log", action="store_true")
+    Master(parser.parse_args()).run()
@@ -0,0 +1,175 @@
+"""Abuse protection for submissions: per-client token buckets and duplicate suppression.
+
+`RateLimitMiddleware` answers over-limit requests before the body is read or
+any route code runs. Buckets live in a pluggable store: `MemoryBuckets` limits
+each worker separately; `SQLiteBuckets` keeps them in a file that every worker
+on the host shares. `DuplicateFilter` remembers recent submissions by content
+hash so that resubmissions are dropped before they reach the database.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+class MemoryBuckets:
+    """Token buckets in this process; each worker enforces the limit on its own."""
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    async def take(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        if key not in self.buckets and len(self.buckets) >= self.max_keys:
+            self._prune(now)
+        self.buckets[key] = (tokens, now)
+        return allowed
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket at all
+        self.buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self.buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
+        if len(self.buckets) >= self.max_keys:
+            for key in list(islice(self.buckets, len(self.buckets) // 2)):
+                del self.buckets[key]
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by every worker on the host.
+
+    Each check is one atomic upsert, run in a thread so that waiting on another
+    worker's write does not block the event loop. Full buckets are swept now and then.
+    """
+    def __init__(self, path, rate, burst, sweep_every=1000):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_every = sweep_every
+        self.calls = 0
+        self.path = path
+        self.db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened on first use, so each prefork worker gets its own connection
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("PRAGMA busy_timeout=1000")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets"
+            " (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)"
+        )
+        return db
+
+    async def take(self, key, now):
+        return await asyncio.to_thread(self._take, key, now)
+
+    def _take(self, key, now):
+        # One connection, used by one thread at a time
+        with self._lock:
+            if self.db is None:
+                self.db = self._connect()
+            return self._upsert(key, now)
+
+    def _upsert(self, key, now):
+        # SET expressions all see the old row, so `allowed` and `tokens` agree
+        refilled = "min(:burst, tokens + (:now - updated) * :rate)"
+        row = self.db.execute(
+            "INSERT INTO buckets (key, tokens, updated, allowed) VALUES (:key, :burst - 1, :now, 1)"
+            " ON CONFLICT(key) DO UPDATE SET"
+            f" allowed = {refilled} >= 1,"
+            f" tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END,"
+            " updated = :now"
+            " RETURNING allowed",
+            {"key": key, "now": now, "rate": self.rate, "burst": self.burst},
+        ).fetchone()
+        self.calls += 1
+        if self.calls % self.sweep_every == 0:
+            self.db.execute("DELETE FROM buckets WHERE updated < ?", (now - self.burst / self.rate,))
+        return bool(row[0])
+
+def client_ip(scope, trust_forwarded=False):
+    if trust_forwarded:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class RateLimitMiddleware:
+    """Limit requests to `paths` per client IP, answering 429 straight from the middleware.
+
+    The 429 carries htmx headers that put its message in the form's status area.
+    """
+    def __init__(self, app, buckets, paths, methods=("POST",), trust_forwarded=False, retry_after=10):
+        self.app = app
+        self.buckets = buckets
+        self.paths = set(paths)
+        self.methods = set(methods)
+        self.trust_forwarded = trust_forwarded
+        self.allowed = 0
+        self.limited = 0
+        self.headers = [
+            (b"content-type", b"text/html; charset=utf-8"),
+            (b"retry-after", str(retry_after).encode()),
+            (b"hx-retarget", b"#form-status"),
+            (b"hx-reswap", b"innerHTML"),
+        ]
+        self.body = b"<p>Error: You are posting too fast. Please wait a moment and try again.</p>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or scope["method"] not in self.methods:
+            return await self.app(scope, receive, send)
+        if await self.buckets.take(client_ip(scope, self.trust_forwarded), time.time()):
+            self.allowed += 1
+            return await self.app(scope, receive, send)
+        self.limited += 1
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [*self.headers, (b"content-length", str(len(self.body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": self.body})
+
+    def stats(self):
+        return {"allowed": self.allowed, "limited": self.limited}
+
+class DuplicateFilter:
+    """Remember content hashes of recent submissions for `window` seconds."""
+    def __init__(self, window, max_entries=100_000):
+        self.window = window
+        self.max_entries = max_entries
+        self.seen = OrderedDict()
+        self.deduped = 0
+
+    @staticmethod
+    def key(name, message):
+        return hashlib.sha256(f"{name}\0{message}".encode()).digest()
+
+    def check(self, key, now=None):
+        """Record `key` and return True, or return False if it was seen within the window."""
+        now = time.monotonic() if now is None else now
+        # Entries are in insertion order, so expired ones are all at the front
+        while self.seen and (next(iter(self.seen.values())) < now - self.window or len(self.seen) >= self.max_entries):
+            self.seen.popitem(last=False)
+        if key in self.seen:
+            self.deduped += 1
+            return False
+        self.seen[key] = now
+        return True
+
+    def forget(self, key):
+        # For submissions that failed to store, so they can be retried at once
+        self.seen.pop(key, None)
+
+    def stats(self):
+        return {"deduped": self.deduped, "size": len(self.seen)}
@@ -0,0 +1,679 @@
+"""Storage backends for guestbook entries.
+
+Entries are dicts with `_id`, `name`, `message`, a UTC `created_at` and a
+`status`. Reads return APPROVED entries newest first; only `scan()` and
+`pending()` see PENDING ones. Mongo entries without a status count as approved.
+`before` arguments are (created_at, id) keys, and `fetch()` with `preview_chars`
+truncates messages inside the database and flags them `truncated`.
+
+`search()` returns entries containing all the given words: for SQLite the most
+recently inserted first, for Mongo the best text score first, within
+`search_max_results`. Pages continue from `search_cursor()`, read back with
+`parse_search_cursor()`.
+
+Messages longer than `compress_chars` keep a `head_chars` head in `message` and
+the full text compressed in `body`. `archive()` moves the oldest entries to a
+cold tier, which reads continue into and `search()` does not cover. `scan()`
+and `import_many()` back transfer.py.
+"""
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import BulkWriteError
+from sqlite_minutils.db import Database
+
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+OLDEST_FIRST = [("created_at", 1), ("_id", 1)]
+DUPLICATE_KEY = 11000
+
+APPROVED = "approved"
+PENDING = "pending"
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+def compress_body(text, codec):
+    data = text.encode()
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+def decompress_body(data):
+    # The codec is told apart by the zstd frame magic, so the setting can change
+    if data[:4] == ZSTD_MAGIC:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    return zlib.decompress(data).decode()
+
+def pack_message(message, compress_chars, head_chars, codec):
+    """(stored message, full length, compressed body); the last two are None if it stays plain."""
+    if not compress_chars or len(message) <= compress_chars:
+        return message, None, None
+    return message[:head_chars], len(message), compress_body(message, codec)
+
+def unpack(entry):
+    """Restore a compressed body, if the entry has one, into `message`."""
+    body = entry.pop("body", None)
+    entry.pop("full_length", None)
+    if body is not None:
+        entry["message"] = decompress_body(body)
+    return entry
+
+def last_key(entries, before):
+    # Where a read that ran out of hot entries continues in the cold tier, after the oldest hot one
+    return (entries[-1].get("created_at"), entries[-1]["_id"]) if entries else before
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, from the driver's connection monitoring events."""
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_checked_out(self, event):
+        self.in_use += 1
+        self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        self.in_use -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    # The remaining events are not counted
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def stats(self):
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+        }
+
+class MongoStorage:
+    def __init__(
+        self, uri, db_name, collection_name, max_pool_size=100, min_pool_size=0, timeout_ms=2000,
+        compress_chars=0, head_chars=1000, codec="zlib", search_max_results=1000,
+    ):
+        self.pool = PoolStats()
+        self.uri = uri
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.options = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "serverSelectionTimeoutMS": timeout_ms,
+            "connectTimeoutMS": timeout_ms,
+        }
+        self.compress_chars = compress_chars
+        self.head_chars = head_chars
+        self.codec = codec
+        self.search_max_results = search_max_results
+        self.client = None
+        self.collection = None
+        self.cold = None
+
+    async def connect(self):
+        if self.client is None:
+            # Created on connect rather than in __init__, so that a prefork
+            # master can import the app and each worker gets its own client:
+            # the driver's sockets and monitor threads do not survive fork()
+            self.client = AsyncIOMotorClient(self.uri, event_listeners=[self.pool], **self.options)
+            self.collection = self.client[self.db_name][self.collection_name]
+            self.cold = self.client[self.db_name][f"{self.collection_name}_cold"]
+        await self.client.server_info()
+        await self.collection.create_index(NEWEST_FIRST, name="created_at_desc")
+        # Reads select approved entries (or unset, for older ones) and sort by recency
+        await self.collection.create_index([("status", 1), *NEWEST_FIRST], name="status_created_at_desc")
+        await self.cold.create_index([("status", 1), *NEWEST_FIRST], name="status_created_at_desc")
+        # MongoDB updates the text index on every insert
+        await self.collection.create_index([("name", "text"), ("message", "text")], name="text_search")
+
+    def new_id(self):
+        return ObjectId()
+
+    def parse_id(self, text):
+        try:
+            return ObjectId(text)
+        except (InvalidId, TypeError):
+            raise ValueError(f"Invalid message id: {text!r}")
+
+    def parse_search_cursor(self, text):
+        # Search pages are offsets into the ranked matches
+        try:
+            offset = int(text)
+        except (TypeError, ValueError):
+            offset = -1
+        if not 0 <= offset < self.search_max_results:
+            raise ValueError(f"Invalid search cursor: {text!r}")
+        return offset
+
+    def search_cursor(self, before, page):
+        offset = (before or 0) + len(page)
+        return str(offset) if offset < self.search_max_results else None
+
+    def _pack(self, entry, compress_chars):
+        message, full_length, body = pack_message(entry["message"], compress_chars, self.head_chars, self.codec)
+        if body is None:
+            return entry
+        return {**entry, "message": message, "full_length": full_length, "body": body}
+
+    async def insert(self, entry):
+        doc = self._pack(entry, self.compress_chars)
+        await self.collection.insert_one(doc)
+        entry["_id"] = doc["_id"]
+
+    async def insert_many(self, entries):
+        """Insert a batch and return the entries that could not be written."""
+        docs = [self._pack(entry, self.compress_chars) for entry in entries]
+        failed = set()
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Unordered, so the rest of the batch was written; an entry that is
+            # already there was written by an earlier attempt at this batch
+            failed = {error["index"] for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY}
+        for entry, doc in zip(entries, docs):
+            entry["_id"] = doc["_id"]
+        return [entry for i, entry in enumerate(entries) if i in failed]
+
+    async def _insert_new(self, collection, docs):
+        try:
+            return len((await collection.insert_many(docs, ordered=False)).inserted_ids)
+        except BulkWriteError as e:
+            # Unordered, so every other entry in the batch was still attempted
+            if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                raise
+            return e.details["nInserted"]
+
+    async def import_many(self, entries):
+        ids = [entry["_id"] for entry in entries if "_id" in entry]
+        archived = set(await self.cold.distinct("_id", {"_id": {"$in": ids}})) if ids else set()
+        docs = [self._pack(entry, self.compress_chars) for entry in entries if entry.get("_id") not in archived]
+        return await self._insert_new(self.collection, docs) if docs else 0
+
+    async def scan(self, batch_size=1000):
+        # Raw documents, legacy `timestamp` fields included
+        for collection in (self.collection, self.cold):
+            async for entry in collection.find({}, batch_size=batch_size).sort("_id", 1):
+                yield unpack(entry)
+
+    async def archive(self, cutoff, batch_size):
+        """Move up to `batch_size` of the oldest approved entries dated before `cutoff` to the cold tier."""
+        # Undated legacy entries sort last, so they are the oldest of all
+        query = self._visible({"$or": [{"created_at": {"$lt": cutoff}}, {"created_at": None}]})
+        batch = await self.collection.find(query).sort(OLDEST_FIRST).limit(batch_size).to_list(None)
+        if not batch:
+            return 0
+        # Bodies compressed at write time are moved as they are
+        await self._insert_new(self.cold, [doc if "body" in doc else self._pack(doc, self.head_chars) for doc in batch])
+        # Copied before deleted, so no entry is ever missing. Reads only go on to the
+        # cold tier past the oldest hot entry, so they never see both copies
+        await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        return len(batch)
+
+    def _before_query(self, before):
+        created_at, oid = before
+        if created_at is None:
+            return {"created_at": None, "_id": {"$lt": oid}}
+        return {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": oid}},
+            # Entries without created_at sort after every dated one
+            {"created_at": None},
+        ]}
+
+    def _cursor(self, collection, query, sort, limit, preview_chars, batch_size=0):
+        if preview_chars is None:
+            return collection.find(query, batch_size=batch_size).sort(sort).limit(limit)
+        pipeline = [
+            {"$match": query},
+            {"$sort": dict(sort)},
+            {"$limit": limit},
+            {"$project": self._preview_projection(preview_chars)},
+        ]
+        if batch_size:
+            return collection.aggregate(pipeline, batchSize=batch_size)
+        return collection.aggregate(pipeline)
+
+    def _preview_projection(self, preview_chars):
+        return {
+            "name": 1,
+            "created_at": 1,
+            "timestamp": 1,
+            "message": {"$substrCP": ["$message", 0, preview_chars]},
+            "truncated": {"$gt": [{"$ifNull": ["$full_length", {"$strLenCP": "$message"}]}, preview_chars]},
+        }
+
+    def _visible(self, query=None):
+        return {"status": {"$in": [APPROVED, None]}, **(query or {})}
+
+    async def fetch(self, limit, before=None, preview_chars=None):
+        query = self._visible(self._before_query(before) if before else None)
+        entries = await self._cursor(self.collection, query, NEWEST_FIRST, limit, preview_chars).to_list(None)
+        if len(entries) < limit:
+            cold_before = last_key(entries, before)
+            query = self._visible(self._before_query(cold_before) if cold_before else None)
+            entries += await self._cursor(self.cold, query, NEWEST_FIRST, limit - len(entries), preview_chars).to_list(None)
+        return [unpack(entry) for entry in entries]
+
+    async def iterate(self, limit, before=None, preview_chars=None, batch_size=100):
+        for collection in (self.collection, self.cold):
+            query = self._visible(self._before_query(before) if before else None)
+            async for entry in self._cursor(collection, query, NEWEST_FIRST, limit, preview_chars, batch_size):
+                before = (entry.get("created_at"), entry["_id"])
+                limit -= 1
+                yield unpack(entry)
+            if limit <= 0:
+                return
+
+    async def watch_inserts(self):
+        # Change streams need a replica set; this raises on a standalone server
+        # Pending entries are announced when they are approved, which is an update
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.status": {"$ne": PENDING}}}]
+        async with self.collection.watch(pipeline) as stream:
+            async for change in stream:
+                yield unpack(change["fullDocument"])
+
+    async def search(self, terms, limit, before=None, preview_chars=None):
+        # Quoted terms must all match; bare ones would be ORed
+        query = self._visible({"$text": {"$search": " ".join(f'"{term}"' for term in terms)}})
+        offset = before or 0
+        limit = min(limit, self.search_max_results - offset)
+        if limit <= 0:
+            return []
+        pipeline = [
+            {"$match": query},
+            # Every match is scored; with the limit folded into the sort, only
+            # the best offset + limit are held at a time
+            {"$sort": {"score": {"$meta": "textScore"}, "_id": -1}},
+            {"$skip": offset},
+            {"$limit": limit},
+        ]
+        if preview_chars is not None:
+            pipeline.append({"$project": self._preview_projection(preview_chars)})
+        entries = await self.collection.aggregate(pipeline).to_list(None)
+        return [unpack(entry) for entry in entries]
+
+    async def get(self, entry_id):
+        for collection in (self.collection, self.cold):
+            entry = await collection.find_one(self._visible({"_id": entry_id}))
+            if entry is not None:
+                return unpack(entry)
+        return None
+
+    async def newest_id(self):
+        for collection in (self.collection, self.cold):
+            newest = await collection.find_one(self._visible(), {"_id": 1}, sort=NEWEST_FIRST)
+            if newest is not None:
+                return newest["_id"]
+        return None
+
+    async def pending(self, limit, after=None):
+        query = {"status": PENDING, **({"_id": {"$gt": after}} if after is not None else {})}
+        entries = await self.collection.find(query).sort("_id", 1).limit(limit).to_list(None)
+        return [unpack(entry) for entry in entries]
+
+    async def approve(self, entry_id, created_at):
+        # Only a pending entry, so of several workers reviewing it one wins
+        result = await self.collection.update_one(
+            {"_id": entry_id, "status": PENDING}, {"$set": {"status": APPROVED, "created_at": created_at}}
+        )
+        return result.matched_count == 1
+
+    async def reject(self, entry_id):
+        return (await self.collection.delete_one({"_id": entry_id, "status": PENDING})).deleted_count == 1
+
+    async def delete(self, entry_id):
+        await self.collection.delete_one({"_id": entry_id})
+        await self.cold.delete_one({"_id": entry_id})
+
+    async def count(self):
+        # From collection metadata, so it does not scan
+        return await self.collection.estimated_document_count() + await self.cold.estimated_document_count()
+
+    async def tier_stats(self):
+        stats = {}
+        for tier, collection in (("hot", self.collection), ("cold", self.cold)):
+            coll_stats = await self.client[self.db_name].command("collStats", collection.name)
+            stats[tier] = {
+                "entries": coll_stats["count"],
+                "data_bytes": coll_stats["size"],
+                "storage_bytes": coll_stats["storageSize"],
+                "index_bytes": coll_stats["totalIndexSize"],
+            }
+        return stats
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+def to_millis(dt):
+    return int(dt.timestamp() * 1000)
+
+def from_millis(millis):
+    return datetime.fromtimestamp(millis / 1000, timezone.utc)
+
+# New row ids continue past archived ones, which SQLite alone would reuse
+# once the highest ids have left the hot table, and past ids that new_id()
+# has reserved in any process
+NEXT_ID = (
+    "(SELECT max(id) + 1 FROM (SELECT max(id) AS id FROM messages UNION ALL"
+    " SELECT max(id) FROM messages_cold UNION ALL SELECT next - 1 FROM id_blocks))"
+)
+ID_BLOCK = 100
+MAX_ROWID = 2**63 - 1
+
+class SQLiteStorage:
+    """Single-file SQLite store in WAL mode, for single-node deployments and benchmarks.
+
+    Queries are local, indexed and short, so they run inline on the event loop.
+    Archived entries live in `messages_cold`, which has the same columns.
+    """
+    def __init__(self, path, compress_chars=0, head_chars=1000, codec="zlib"):
+        self.path = path
+        self.compress_chars = compress_chars
+        self.head_chars = head_chars
+        self.codec = codec
+        self.db = None
+        self.reserved = range(0)
+
+    async def connect(self):
+        self.db = Database(self.path)
+        self.db.enable_wal()
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for table in ("messages", "messages_cold"):
+            self.db[table].create(
+                {"id": int, "name": str, "message": str, "created_at": int, "status": str,
+                 "full_length": int, "body": bytes},
+                pk="id",
+                not_null={"name", "message", "created_at", "status"},
+                defaults={"status": APPROVED},
+                if_not_exists=True,
+            )
+        columns = self.db["messages"].columns_dict
+        if "status" not in columns:
+            self.db["messages"].add_column("status", str, not_null_default=APPROVED)
+        # Set only on rows whose message is compressed
+        if "full_length" not in columns:
+            self.db["messages"].add_column("full_length", int)
+            self.db["messages"].add_column("body", bytes)
+        self.db["messages"].create_index(["created_at"], if_not_exists=True)
+        for table in ("messages", "messages_cold"):
+            # With the implicit rowid last, this serves WHERE status = ? ORDER BY created_at, id
+            self.db[table].create_index(["status", "created_at"], if_not_exists=True)
+        if not self.db["messages"].detect_fts():
+            # External-content FTS5 table; its triggers index every insert
+            self.db["messages"].enable_fts(["name", "message"], create_triggers=True)
+        # One row: the first id no process has reserved
+        self.db["id_blocks"].create({"next": int}, not_null={"next"}, if_not_exists=True)
+        self.db.execute("INSERT INTO id_blocks (next) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM id_blocks)")
+        self.reserved = range(0)
+
+    def new_id(self):
+        # Reserved ID_BLOCK at a time, so a write-behind card has its id before the
+        # flush; workers sharing the file each get blocks of their own
+        if not self.reserved:
+            end = self.db.execute(f"UPDATE id_blocks SET next = {NEXT_ID} + ? RETURNING next", (ID_BLOCK,)).fetchone()[0]
+            self.reserved = range(end - ID_BLOCK, end)
+        entry_id, self.reserved = self.reserved[0], self.reserved[1:]
+        return entry_id
+
+    def parse_id(self, text):
+        try:
+            return int(text)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid message id: {text!r}")
+
+    def parse_search_cursor(self, text):
+        return self.parse_id(text)
+
+    def search_cursor(self, before, page):
+        return str(page[-1]["_id"])
+
+    def _row(self, entry, compress_chars):
+        message, full_length, body = pack_message(entry["message"], compress_chars, self.head_chars, self.codec)
+        return (
+            entry.get("_id"), entry["name"], message, to_millis(entry["created_at"]),
+            entry.get("status", APPROVED), full_length, body,
+        )
+
+    def _insert(self, entry):
+        cursor = self.db.execute(
+            "INSERT INTO messages (id, name, message, created_at, status, full_length, body)"
+            f" VALUES (coalesce(?, {NEXT_ID}), ?, ?, ?, ?, ?, ?)",
+            self._row(entry, self.compress_chars),
+        )
+        entry["_id"] = cursor.lastrowid
+
+    async def insert(self, entry):
+        self._insert(entry)
+
+    async def insert_many(self, entries):
+        # One transaction per batch instead of one commit per row, so all or nothing
+        self.db.execute("BEGIN")
+        try:
+            for entry in entries:
+                self._insert(entry)
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return []
+
+    async def import_many(self, entries):
+        # Entries without an id get a new one, like any other new row
+        rows = (self._row(entry, self.compress_chars) for entry in entries)
+        self.db.execute("BEGIN")
+        try:
+            cursor = self.db.conn.executemany(
+                "INSERT OR IGNORE INTO messages (id, name, message, created_at, status, full_length, body)"
+                f" SELECT coalesce(?1, {NEXT_ID}), ?2, ?3, ?4, ?5, ?6, ?7"
+                " WHERE NOT EXISTS (SELECT 1 FROM messages_cold WHERE id = ?1)", rows
+            )
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return cursor.rowcount
+
+    async def scan(self, batch_size=1000):
+        for table in ("messages", "messages_cold"):
+            last_id = 0
+            while True:
+                rows = self.db.execute(
+                    f"SELECT id, name, message, created_at, body, status FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+                for row in rows:
+                    yield {**self._entry(row[:5]), "status": row[5]}
+                if len(rows) < batch_size:
+                    break
+                last_id = rows[-1][0]
+
+    async def archive(self, cutoff, batch_size):
+        """Move up to `batch_size` of the oldest approved entries dated before `cutoff` to messages_cold."""
+        rows = self.db.execute(
+            "SELECT id, name, message, created_at, status, full_length, body FROM messages"
+            " WHERE status = ? AND created_at < ? ORDER BY created_at, id LIMIT ?",
+            (APPROVED, to_millis(cutoff), batch_size),
+        ).fetchall()
+        if not rows:
+            return 0
+        # Bodies compressed at write time are moved as they are
+        cold_rows = [
+            row if row[6] is not None
+            else self._row({"_id": row[0], "name": row[1], "message": row[2], "created_at": from_millis(row[3])}, self.head_chars)
+            for row in rows
+        ]
+        self.db.execute("BEGIN")
+        try:
+            self.db.conn.executemany(
+                "INSERT OR IGNORE INTO messages_cold (id, name, message, created_at, status, full_length, body)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", cold_rows
+            )
+            self.db.conn.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        return len(rows)
+
+    def _entry(self, row):
+        row_id, name, message, created_at, body = row
+        if body is not None:
+            message = decompress_body(body)
+        return {"_id": row_id, "name": name, "message": message, "created_at": from_millis(created_at)}
+
+    def _preview(self, row):
+        row_id, name, message, truncated, created_at = row
+        return {
+            "_id": row_id,
+            "name": name,
+            "message": message,
+            "truncated": bool(truncated),
+            "created_at": from_millis(created_at),
+        }
+
+    def _columns(self, preview_chars):
+        if preview_chars is None:
+            return "id, name, message, created_at, body", (), self._entry
+        # Previews come from the uncompressed head, which is at least PREVIEW_CHARS long
+        columns = "id, name, substr(message, 1, ?), coalesce(full_length, length(message)) > ?, created_at"
+        return columns, (preview_chars, preview_chars), self._preview
+
+    def _fetch(self, table, limit, before, preview_chars):
+        columns, params, make = self._columns(preview_chars)
+        if before:
+            created_at, row_id = before
+            if created_at is None:
+                # Every SQLite entry is dated, so nothing sorts after an undated key
+                return []
+            rows = self.db.execute(
+                f"SELECT {columns} FROM {table} WHERE status = ? AND (created_at, id) < (?, ?)"
+                " ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, APPROVED, to_millis(created_at), row_id, limit),
+            )
+        else:
+            rows = self.db.execute(
+                f"SELECT {columns} FROM {table} WHERE status = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, APPROVED, limit),
+            )
+        return [make(row) for row in rows]
+
+    async def fetch(self, limit, before=None, preview_chars=None):
+        entries = self._fetch("messages", limit, before, preview_chars)
+        if len(entries) < limit:
+            entries += self._fetch("messages_cold", limit - len(entries), last_key(entries, before), preview_chars)
+        return entries
+
+    async def iterate(self, limit, before=None, preview_chars=None, batch_size=100):
+        # Keyset batches rather than one long-lived cursor, so writes can interleave
+        while limit > 0:
+            batch = await self.fetch(min(batch_size, limit), before, preview_chars)
+            for entry in batch:
+                yield entry
+            if len(batch) < min(batch_size, limit):
+                return
+            limit -= len(batch)
+            before = (batch[-1]["created_at"], batch[-1]["_id"])
+
+    async def search(self, terms, limit, before=None, preview_chars=None):
+        columns, params, make = self._columns(preview_chars)
+        # Quoted so that FTS5 query syntax in the input is taken literally
+        match = " ".join(f'"{term}"' for term in terms)
+        # FTS5 reads its index in rowid order, so the LIMIT stops the scan early;
+        # the status check sits inside it so pending matches do not shorten the page
+        rows = self.db.execute(
+            f"SELECT {columns} FROM messages WHERE id IN ("
+            "SELECT messages_fts.rowid FROM messages_fts JOIN messages ON messages.id = messages_fts.rowid"
+            " WHERE messages_fts MATCH ? AND messages_fts.rowid < ? AND messages.status = ?"
+            " ORDER BY messages_fts.rowid DESC LIMIT ?) ORDER BY id DESC",
+            (*params, match, MAX_ROWID if before is None else before, APPROVED, limit),
+        )
+        return [make(row) for row in rows]
+
+    async def get(self, entry_id):
+        for table in ("messages", "messages_cold"):
+            row = self.db.execute(
+                f"SELECT id, name, message, created_at, body FROM {table} WHERE id = ? AND status = ?",
+                (entry_id, APPROVED),
+            ).fetchone()
+            if row:
+                return self._entry(row)
+        return None
+
+    async def newest_id(self):
+        for table in ("messages", "messages_cold"):
+            row = self.db.execute(
+                f"SELECT id FROM {table} WHERE status = ? ORDER BY created_at DESC, id DESC LIMIT 1", (APPROVED,)
+            ).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    async def pending(self, limit, after=None):
+        rows = self.db.execute(
+            "SELECT id, name, message, created_at, body FROM messages WHERE status = ? AND id > ? ORDER BY id LIMIT ?",
+            (PENDING, 0 if after is None else after, limit),
+        )
+        return [{**self._entry(row), "status": PENDING} for row in rows]
+
+    async def approve(self, entry_id, created_at):
+        # Only a pending entry, so of several workers reviewing it one wins
+        cursor = self.db.execute(
+            "UPDATE messages SET status = ?, created_at = ? WHERE id = ? AND status = ?",
+            (APPROVED, to_millis(created_at), entry_id, PENDING),
+        )
+        return cursor.rowcount == 1
+
+    async def reject(self, entry_id):
+        return self.db.execute("DELETE FROM messages WHERE id = ? AND status = ?", (entry_id, PENDING)).rowcount == 1
+
+    async def delete(self, entry_id):
+        self.db.execute("DELETE FROM messages WHERE id = ?", (entry_id,))
+        self.db.execute("DELETE FROM messages_cold WHERE id = ?", (entry_id,))
+
+    async def count(self):
+        return sum(self.db.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in ("messages", "messages_cold"))
+
+    async def tier_stats(self):
+        tiers = {"messages": "hot", "messages_cold": "cold"}
+        stats = {
+            tier: {"entries": self.db.execute(f"SELECT count(*) FROM {table}").fetchone()[0], "data_bytes": 0, "index_bytes": 0}
+            for table, tier in tiers.items()
+        }
+        try:
+            sizes = self.db.execute("SELECT name, sum(pgsize) FROM dbstat GROUP BY name").fetchall()
+        except sqlite3.OperationalError:
+            return stats  # SQLite built without the dbstat table
+        owners = dict(self.db.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'").fetchall())
+        for name, size in sizes:
+            if name in tiers:
+                stats[tiers[name]]["data_bytes"] += size
+            elif owners.get(name) in tiers or name.startswith("messages_fts"):
+                # The full-text index covers the hot tier only
+                stats[tiers.get(owners.get(name), "hot")]["index_bytes"] += size
+        return stats
+
+    def pool_stats(self):
+        # One connection, no pool
+        return {}
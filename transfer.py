@@ -0,0 +1,167 @@
+"""Stream guestbook entries to and from NDJSON, for backups and moves between databases.
+
+    python transfer.py export [path] [--batch-size 1000]
+    python transfer.py import [path] [--batch-size 1000] [--checkpoint file] [--restart]
+
+One entry per line, with `created_at` in ISO 8601 (or a legacy `timestamp`)
+and `status` where set. Paths ending in .gz or .zst are compressed (.zst needs
+zstandard); "-" is stdout or stdin. One batch is held in memory at a time.
+
+Import keeps the `_id`s the target backend understands and skips entries
+already present. Progress goes to `<path>.checkpoint` after each batch, and a
+rerun resumes from it. Ids from the other backend are replaced, so across
+backends a batch stored but not yet checkpointed can be inserted twice.
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from main import storage, as_utc, parse_legacy_timestamp
+
+DEFAULT_BATCH_SIZE = 1000
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+@contextmanager
+def open_stream(path, mode):
+    """Text stream for reading ("r") or writing ("w") `path`, compressed by extension."""
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    if path.endswith(".gz"):
+        stream = gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    elif path.endswith(".zst"):
+        import zstandard
+        raw = open(path, mode + "b")
+        if mode == "r":
+            raw = zstandard.ZstdDecompressor().stream_reader(raw)
+        else:
+            raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+        stream = io.TextIOWrapper(raw, encoding="utf-8")
+    else:
+        stream = open(path, mode, encoding="utf-8")
+    with stream:
+        yield stream
+
+def encode(entry):
+    doc = {"_id": str(entry["_id"]), "name": entry.get("name"), "message": entry.get("message")}
+    if entry.get("created_at") is not None:
+        doc["created_at"] = as_utc(entry["created_at"]).isoformat()
+    elif "timestamp" in entry:
+        doc["timestamp"] = entry["timestamp"]
+    if entry.get("status"):
+        doc["status"] = entry["status"]
+    return json.dumps(doc, ensure_ascii=False) + "\n"
+
+def decode(line):
+    doc = json.loads(line)
+    if doc.get("created_at"):
+        created_at = as_utc(datetime.fromisoformat(doc["created_at"]))
+    else:
+        created_at = parse_legacy_timestamp(doc["timestamp"])
+    entry = {"name": doc["name"], "message": doc["message"], "created_at": created_at}
+    if doc.get("status"):
+        # A pending entry stays pending, and is reviewed when the app next starts
+        entry["status"] = doc["status"]
+    try:
+        entry["_id"] = storage.parse_id(doc["_id"])
+    except (KeyError, ValueError):
+        # Ids from the other backend do not fit; a new one is assigned on insert
+        pass
+    return entry
+
+async def export(path, batch_size=DEFAULT_BATCH_SIZE):
+    await storage.connect()
+    exported = 0
+    with open_stream(path, "w") as out:
+        async for entry in storage.scan(batch_size):
+            out.write(encode(entry))
+            exported += 1
+    return exported
+
+def read_checkpoint(path, source):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {"source": source, "lines": 0, "inserted": 0, "skipped": 0}
+    if state["source"] != source:
+        raise ValueError(f"Checkpoint {path} belongs to {state['source']}, not {source}")
+    return state
+
+def write_checkpoint(path, state):
+    # Replaced in one step, so a crash leaves the previous checkpoint intact
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+async def import_entries(path, batch_size=DEFAULT_BATCH_SIZE, checkpoint=None, restart=False):
+    await storage.connect()
+    state = {"source": path, "lines": 0, "inserted": 0, "skipped": 0}
+    if checkpoint and not restart:
+        state = read_checkpoint(checkpoint, path)
+    if state["lines"]:
+        print(f"Resuming after line {state['lines']}", file=sys.stderr)
+
+    async def store(batch, lines, skipped):
+        state["inserted"] += await storage.import_many(batch) if batch else 0
+        state["lines"] = lines
+        state["skipped"] += skipped
+        if checkpoint:
+            write_checkpoint(checkpoint, state)
+
+    batch, skipped, line_number, pending = [], 0, 0, None
+    with open_stream(path, "r") as lines:
+        for line_number, line in enumerate(lines, 1):
+            if line_number <= state["lines"] or not line.strip():
+                continue
+            try:
+                batch.append(decode(line))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping line {line_number}: {e!r}", file=sys.stderr)
+                skipped += 1
+            if len(batch) >= batch_size:
+                # One insert in flight while the next batch is parsed
+                if pending:
+                    await pending
+                pending = asyncio.create_task(store(batch, line_number, skipped))
+                await asyncio.sleep(0)  # let it send the batch before parsing resumes
+                batch, skipped = [], 0
+        if pending:
+            await pending
+        await store(batch, max(line_number, state["lines"]), skipped)
+    if checkpoint:
+        os.remove(checkpoint)
+    return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write every entry to NDJSON")
+    import_parser = commands.add_parser("import", help="insert entries from NDJSON")
+    for command in (export_parser, import_parser):
+        command.add_argument("path", nargs="?", default="-")
+        command.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    import_parser.add_argument("--checkpoint", help="default: <path>.checkpoint; none when reading stdin")
+    import_parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # Reports go to stderr, since stdout may be the export itself
+    if args.command == "export":
+        count = asyncio.run(export(args.path, args.batch_size))
+        print(f"Exported {count} messages in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    else:
+        checkpoint = args.checkpoint or (None if args.path == "-" else args.path + ".checkpoint")
+        state = asyncio.run(import_entries(args.path, args.batch_size, checkpoint, args.restart))
+        print(
+            f"Imported {state['inserted']} of {state['lines']} lines in {time.perf_counter() - start:.1f}s"
+            f" ({state['skipped']} unreadable, the rest already present)",
+            file=sys.stderr,
+        )